@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Collage benchmarks - time layout, render, thumbnails and viewer frames on synthetic images
+
+Run from the repository root:
+
+    python -m benchmarks.bench_collage --counts 10,100,1000 --output results.json
+    python -m benchmarks.bench_collage --output new.json --baseline results.json --threshold 0.2
+
+The exit status is 1 when a timing regressed by more than `--threshold` against `--baseline`.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from chewie.collage_maker import read_image_sizes, render_collage
+from chewie.layout import compute_layout
+
+# synthetic images cycle through these formats
+FORMATS = ('JPEG', 'PNG', 'GIF', 'BMP', 'WEBP')
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'BMP': 'bmp', 'WEBP': 'webp'}
+# from panoramas to tall portraits
+ASPECT_RATIOS = (0.5, 0.66, 0.75, 1.0, 1.33, 1.5, 1.78, 2.4, 3.0)
+
+
+def generate_images(folder, count, max_side, seed=0):
+    """
+    Write `count` synthetic images of varied aspect ratios and formats into `folder`.
+    Identical shapes are saved once and copied, so large sets are generated quickly.
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    originals = {}
+    images = []
+    for i in range(count):
+        image_format = FORMATS[i % len(FORMATS)]
+        ratio = rng.choice(ASPECT_RATIOS)
+        side = rng.randrange(max_side // 2, max_side + 1, 16)
+        size = (side, max(1, int(side / ratio))) if ratio >= 1 else (max(1, int(side * ratio)), side)
+        path = os.path.join(folder, f'img{i:06d}.{EXTENSIONS[image_format]}')
+        key = (image_format, size)
+        if key in originals:
+            shutil.copyfile(originals[key], path)
+        else:
+            img = Image.effect_noise(size, 64).convert('RGB')
+            if image_format == 'GIF':
+                img = img.convert('P')
+            img.save(path, image_format)
+            originals[key] = path
+        images.append(path)
+    return images
+
+
+def best_time(func, repeat):
+    """Return the best wall time of `repeat` calls of `func`, and the result of the last one."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_collage(images, width, height, jobs, repeat):
+    """Time the layout and the render passes of a collage separately."""
+    def layout():
+        sizes = read_image_sizes(images)
+        return compute_layout(sizes, width, height)
+
+    layout_time, (rows, out_height) = best_time(layout, repeat)
+    render_time, _ = best_time(
+        lambda: render_collage(images, rows, width, out_height, jobs), repeat
+    )
+    return {'layout': layout_time, 'render': render_time}
+
+
+def wait_for_collage(viewer, timeout=600):
+    """
+    Apply the results of the background worker until the viewer shows its complete collage.
+    The first collage is rendered progressively, frames timed before would draw placeholders.
+    """
+    deadline = time.perf_counter() + timeout
+    while viewer.partial_collage:
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f'The viewer collage was not rendered within {timeout} s')
+        viewer._poll_collage()
+        time.sleep(0.001)
+    if viewer.collage_error is not None:
+        raise RuntimeError(f'The viewer collage failed to render: {viewer.collage_error}')
+
+
+def bench_viewer(images, width, height, repeat, frames):
+    """Time the thumbnails of the first screen and full viewer frames, with no display."""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from chewie.windows import CollageViewer
+
+    pygame.init()
+    viewer = CollageViewer(images, os.devnull, width, height)
+    try:
+        # the render in the background would compete with the timed work
+        wait_for_collage(viewer)
+
+        def thumbnails():
+            viewer.thumbnail_loader.stop()
+            viewer._load_image_thumbnails()
+            viewer._setup_thumbnail_dragger()
+            viewer._update_thumbnail_window()
+            visible = viewer._visible_thumbnail_rows()
+            # wait for the visible thumbnails, loaded in the background
+            while any(viewer.image_thumbnails[i]['surface'] is None for i in visible):
+                viewer._poll_thumbnails()
+                time.sleep(0.001)
+
+        thumbnails_time, _ = best_time(thumbnails, repeat)
+
+        def frame():
+            for _ in range(frames):
+                viewer._mark_dirty()
+                viewer.render()
+
+        frame_time, _ = best_time(frame, repeat)
+    finally:
+        viewer.collage_worker.stop()
+        viewer.thumbnail_loader.stop()
+        pygame.quit()
+    return {'thumbnails': thumbnails_time, 'frame': frame_time / frames}
+
+
+def compare(results, baseline, threshold):
+    """Return the `(name, baseline, result)` of timings slower than `baseline` by `threshold`."""
+    regressions = []
+    for name, value in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous and value > previous * (1 + threshold):
+            regressions.append((name, previous, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counts', default='10,100,1000',
+                        help='Comma separated numbers of images, up to 50000')
+    parser.add_argument('--max-side', type=int, default=512, help='Longest side of the images')
+    parser.add_argument('--width', type=int, default=1600, help='Width of the collages')
+    parser.add_argument('--height', type=int, default=200, help='Target height of the rows')
+    parser.add_argument('--jobs', type=int, default=1, help='Threads decoding images')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each timing, the best is kept')
+    parser.add_argument('--frames', type=int, default=20, help='Viewer frames per timing')
+    parser.add_argument('--max-viewer-images', type=int, default=2000,
+                        help='Skip the viewer benchmarks of larger image sets')
+    parser.add_argument('--workdir', help='Where image sets are generated and kept (temporary by default)')
+    parser.add_argument('--output', '-o', help='JSON file the results are written to')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='chewie-bench-')
+    results = {}
+    try:
+        for count in [int(count) for count in args.counts.split(',')]:
+            folder = os.path.join(workdir, f'{count}-{args.max_side}')
+            images = generate_images(folder, count, args.max_side)
+            timings = bench_collage(images, args.width, args.height, args.jobs, args.repeat)
+            if count <= args.max_viewer_images:
+                timings.update(bench_viewer(images, args.width, args.height, args.repeat, args.frames))
+            for name, value in timings.items():
+                results[f'{name}/{count}'] = value
+                print(f'{name:>10} {count:>6} images: {value * 1000:10.2f} ms')
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, previous, value in regressions:
+            print(f'REGRESSION {name}: {previous * 1000:.2f} ms -> {value * 1000:.2f} ms')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
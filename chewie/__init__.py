@@ -1,2 +1,22 @@
 # Chewie CLI package
-# This file can be left empty or used for package-level imports in the future
\ No newline at end of file
+# The collage API is importable without pygame, only the viewer needs it
+from .collage_maker import (
+    collage_array, create_collage, encode_collage, plan_collage, render_plan, save_collage
+)
+from .errors import CollageError, EmptyCollageError, ImageSourceError, NoImagesError, PlanError
+from .plan import LayoutPlan
+
+__all__ = [
+    'CollageError',
+    'EmptyCollageError',
+    'ImageSourceError',
+    'LayoutPlan',
+    'NoImagesError',
+    'PlanError',
+    'collage_array',
+    'create_collage',
+    'encode_collage',
+    'plan_collage',
+    'render_plan',
+    'save_collage',
+]
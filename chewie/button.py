@@ -1,5 +1,7 @@
 import pygame
 
+from .fonts import get_font, render_text
+
 
 class Button:
     def __init__(self, x, y, width, height, text, color=(200, 200, 200), text_color=(0, 0, 0)):
@@ -18,13 +20,14 @@ class Button:
         self.text = text
         self.color = color
         self.text_color = text_color
-        self.font = pygame.font.Font(None, 24)
+        self.font_size = 24
+        self.font = get_font(self.font_size)
     
     def draw(self, surface):
         """Draw the button on the given surface"""
         pygame.draw.rect(surface, self.color, self.rect)
         pygame.draw.rect(surface, (100, 100, 100), self.rect, 2)  # Border
-        text_surface = self.font.render(self.text, True, self.text_color)
+        text_surface = render_text(self.text, self.font_size, self.text_color)
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect)
     
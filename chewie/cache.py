@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Derivative cache - keep resized images and image sizes on disk between runs
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(text):
+    """
+    Parse a number of bytes such as '2GB', '512M', '1.5g' or '1048576'.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*', str(text), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'Invalid size: {text}')
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def default_cache_dir():
+    """
+    Return the per-user cache directory of chewie.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'chewie')
+
+
+def source_key(img_path):
+    """
+    Return a key identifying the current content of the file at `img_path`.
+    """
+    stat = os.stat(img_path)
+    return f'{os.path.abspath(img_path)}|{stat.st_mtime_ns}|{stat.st_size}'
+
+
+class DerivativeCache:
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Cache of resized images and image sizes, keyed by path, mtime, file size and target size.
+        Derivatives are evicted least recently used first once they take more than `max_bytes`.
+
+        :param cache_dir: Cache directory, the per-user cache directory by default
+        :param max_bytes: Size cap of the stored derivatives
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes_path = os.path.join(self.cache_dir, 'sizes.json')
+        self._sizes = None
+        self._sizes_dirty = False
+        self._total_bytes = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _load_sizes(self):
+        """Load the image sizes index, once."""
+        if self._sizes is None:
+            try:
+                with open(self._sizes_path) as f:
+                    self._sizes = json.load(f)
+            except (OSError, ValueError):
+                self._sizes = {}
+        return self._sizes
+
+    def get_size(self, img_path):
+        """Return the cached (width, height) of the image at `img_path`, or None."""
+        key = source_key(img_path)
+        with self._lock:
+            size = self._load_sizes().get(key)
+        return tuple(size) if size else None
+
+    def put_size(self, img_path, size):
+        """Remember the (width, height) of the image at `img_path`."""
+        key = source_key(img_path)
+        with self._lock:
+            self._load_sizes()[key] = list(size)
+            self._sizes_dirty = True
+
+    def flush(self):
+        """Write the image sizes index to disk, if it changed."""
+        with self._lock:
+            if not self._sizes_dirty:
+                return
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._sizes, f)
+            os.replace(tmp_path, self._sizes_path)
+            self._sizes_dirty = False
+
+    def _derivative_path(self, img_path, size, downscale):
+        """Return the path of the derivative of `img_path` resized to `size`."""
+        key = f'{source_key(img_path)}|{size[0]}x{size[1]}|{downscale}'
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.png')
+
+    def get_image(self, img_path, size, downscale):
+        """Return the cached derivative of `img_path` resized to `size`, or None."""
+        path = self._derivative_path(img_path, size, downscale)
+        try:
+            with Image.open(path) as img:
+                img.load()
+            # bump the modification time, which orders the eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return img
+
+    def put_image(self, img_path, size, downscale, img):
+        """Store `img`, the derivative of `img_path` resized to `size`."""
+        path = self._derivative_path(img_path, size, downscale)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry[1] for entry in self._scan())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                # favour speed over ratio, derivatives are small already
+                img.save(f, 'PNG', compress_level=1)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError, KeyError):
+            # some modes (CMYK, 16 bits...) can't be stored as PNG, they are not cached
+            os.remove(tmp_path)
+            return
+        with self._lock:
+            self._total_bytes += os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        """Yield `(path, size, mtime)` of every stored derivative."""
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir():
+                continue
+            for sub_entry in os.scandir(entry.path):
+                if sub_entry.name.endswith('.png'):
+                    stat = sub_entry.stat()
+                    yield sub_entry.path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """Remove least recently used derivatives, down to 90% of the size cap."""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        self._total_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+
+
+class DecodedImageCache:
+    def __init__(self, max_bytes, parent=None):
+        """
+        In-memory cache of decoded images at the sizes they were requested at, and of image
+        sizes. Images are evicted least recently used first once they take more than `max_bytes`.
+        It has the interface of `DerivativeCache`, which it can sit in front of.
+        Cached images are shared, callers must not modify them.
+
+        :param max_bytes: Memory budget of the decoded images
+        :param parent: Optional cache to fall back to, and to write through to
+        """
+        self.max_bytes = max_bytes
+        self.parent = parent
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        self._sizes = {}
+
+    def get_size(self, img_path):
+        """Return the cached (width, height) of the image at `img_path`, or None."""
+        key = source_key(img_path)
+        with self._lock:
+            size = self._sizes.get(key)
+        if size is None and self.parent is not None:
+            size = self.parent.get_size(img_path)
+            if size is not None:
+                with self._lock:
+                    self._sizes[key] = size
+        return size
+
+    def put_size(self, img_path, size):
+        """Remember the (width, height) of the image at `img_path`."""
+        with self._lock:
+            self._sizes[source_key(img_path)] = tuple(size)
+        if self.parent is not None:
+            self.parent.put_size(img_path, size)
+
+    def flush(self):
+        """Write what the parent cache keeps on disk."""
+        if self.parent is not None:
+            self.parent.flush()
+
+    def get_image(self, img_path, size, downscale):
+        """Return the decoded image of `img_path` resized to `size`, or None."""
+        key = (source_key(img_path), tuple(size), downscale)
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                return img
+        if self.parent is None:
+            return None
+        img = self.parent.get_image(img_path, size, downscale)
+        if img is not None:
+            self._store(key, img)
+        return img
+
+    def put_image(self, img_path, size, downscale, img):
+        """Store `img`, the decoded image of `img_path` resized to `size`."""
+        self._store((source_key(img_path), tuple(size), downscale), img)
+        if self.parent is not None:
+            self.parent.put_image(img_path, size, downscale, img)
+
+    def _store(self, key, img):
+        """Keep `img` in memory, evicting least recently used images beyond the budget."""
+        nbytes = img.size[0] * img.size[1] * len(img.getbands())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.size[0] * previous.size[1] * len(previous.getbands())
+            self._images[key] = img
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.total_bytes -= evicted.size[0] * evicted.size[1] * len(evicted.getbands())
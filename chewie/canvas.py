@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Array canvas - composite collages into a single preallocated NumPy array, optionally memory-mapped
+"""
+
+import importlib.util
+
+from PIL import Image
+
+from .imaging import has_alpha
+from .profiling import span
+
+# NumPy is optional, only the 'numpy' compositor needs it. It is imported by the canvases,
+# so that collages of the 'pil' compositor and the CLI start without loading it.
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+
+# ways of compositing collages: one PIL canvas, or one NumPy array
+COMPOSITORS = ('pil', 'numpy')
+
+
+class ArrayCanvas:
+    def __init__(self, width, height, background, mode='RGB', filename=None):
+        """
+        Canvas of `width` x `height` pixels held in a single `uint8` array, filled with the
+        `background` color. Like PIL canvases, it is opaque until a tile with an alpha channel
+        comes. Pixels always take 4 bytes: opaque canvases are RGBX, which Pillow images can
+        share without a copy, unlike RGB, and the padding byte is an opaque alpha once the
+        canvas becomes RGBA.
+
+        :param width: Width of the canvas
+        :param height: Height of the canvas
+        :param background: RGB background color
+        :param mode: 'RGB' or 'RGBA'
+        :param filename: Optional file the array is memory-mapped to, for collages larger than memory
+        """
+        if not HAS_NUMPY:
+            raise ImportError('The numpy compositor needs NumPy: pip install numpy')
+        import numpy as np
+
+        self.size = (width, height)
+        self.mode = 'RGBA' if mode == 'RGBA' else 'RGBX'
+        self.filename = filename
+        shape = (height, width, 4)
+        if filename is None:
+            self.array = np.empty(shape, np.uint8)
+        else:
+            self.array = np.memmap(filename, np.uint8, 'w+', shape=shape)
+        with span('fill'):
+            self.array[...] = tuple(background) + (255,)
+
+    def paste(self, img, position):
+        """Write `img` into the canvas at the (x, y) `position`, clipped to the canvas."""
+        import numpy as np
+
+        with span('paste'):
+            if self.mode == 'RGBX' and has_alpha(img):
+                # the padding is already an opaque alpha channel
+                self.mode = 'RGBA'
+            x, y = position
+            width = min(img.size[0], self.size[0] - x)
+            height = min(img.size[1], self.size[1] - y)
+            if width <= 0 or height <= 0:
+                return
+            if (width, height) != img.size:
+                img = img.crop((0, 0, width, height))
+            if self.mode == 'RGBA':
+                if img.mode != 'RGBA':
+                    img = img.convert('RGBA')
+                self.array[y:y + height, x:x + width] = np.asarray(img)
+            else:
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                self.array[y:y + height, x:x + width, :3] = np.asarray(img)
+
+    def to_image(self):
+        """
+        Return a PIL image over the array, without copying it: RGBA, or RGBX for opaque
+        canvases. The image is read-only and keeps the array alive, so encoders read the
+        composited pixels directly.
+        """
+        image = Image.frombuffer(self.mode, self.size, self.array, 'raw', self.mode, 0, 1)
+        # lets the viewer build its surface over the same pixels
+        image.canvas_array = self.array
+        return image
+
+
+def canvas_array(image):
+    """
+    Return the array `image` was built over by `ArrayCanvas.to_image`, or None.
+    Arrays have 4 channels, the last one is padding when `image` is RGBX.
+    """
+    return getattr(image, 'canvas_array', None)
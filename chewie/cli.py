@@ -1,7 +1,290 @@
 import click
 import os
-from .windows import CollageViewer
-import pygame
+import struct
+import time
+from click.core import ParameterSource
+from concurrent.futures import ThreadPoolExecutor
+from .canvas import COMPOSITORS, HAS_NUMPY
+from .cache import DecodedImageCache, DerivativeCache, default_cache_dir, parse_size
+from .collage_maker import (
+    StripRenderer, plan_collage, render_plan, render_plans, save_collage, stream_plan
+)
+from .discovery import discover_images
+from .encode import SUBSAMPLINGS, format_of
+from .errors import CollageError, ImageSourceError
+from .imaging import DOWNSCALE_MODES
+from .layout import LAYOUT_ENGINES
+from .plan import LayoutPlan
+from .profiling import Tracer, set_tracer
+from .stream import STREAM_WRITERS
+from .watch import FolderWatcher, update_order
+
+def find_images(input_folder, recursive=False, include=(), exclude=(), dedupe=False):
+    """Get all image files from the input folder, recognized by their content."""
+    return discover_images([input_folder], recursive, include, exclude, dedupe)
+
+
+def discovery_options(func):
+    """Add the options selecting the images of the input folders."""
+    options = [
+        click.option('--recursive', '-r', is_flag=True, help='Also search images in subfolders'),
+        click.option('--include', multiple=True,
+                     help='Only use files matching this glob pattern (repeatable)'),
+        click.option('--exclude', multiple=True,
+                     help='Skip files and folders matching this glob pattern (repeatable)'),
+        click.option('--dedupe', is_flag=True, help='Skip exact duplicates of other images'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def _parse_size_option(ctx, param, value):
+    """Click callback turning a size such as '2GB' into a number of bytes."""
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _check_compositor(ctx, param, value):
+    """Click callback refusing the numpy compositor when NumPy is missing."""
+    if value == 'numpy' and not HAS_NUMPY:
+        raise click.BadParameter('the numpy compositor needs NumPy: pip install numpy')
+    return value
+
+
+def collage_options(func):
+    """Add the options shared by the commands creating collages."""
+    options = [
+        click.option('--width', '-w', default=800, help='Width of the collage'),
+        click.option('--height', '-h', default=600, help='Target height of each image row'),
+        click.option('--layout', '-l', default='justified',
+                     type=click.Choice(sorted(LAYOUT_ENGINES)),
+                     help='Layout engine used to split images into rows'),
+        click.option('--jobs', '-j', default=0, type=click.IntRange(min=0),
+                     help='Number of threads decoding images (0 for one per CPU core)'),
+        click.option('--downscale', '-d', default='balanced', type=click.Choice(DOWNSCALE_MODES),
+                     help='Quality/speed trade-off when shrinking images'),
+        click.option('--cache-dir', type=click.Path(file_okay=False, dir_okay=True), default=None,
+                     help=f'Directory of the resized images cache (default: {default_cache_dir()})'),
+        click.option('--cache-size', default=1024, type=click.IntRange(min=1),
+                     help='Size cap of the resized images cache, in MB'),
+        click.option('--no-cache', is_flag=True,
+                     help='Do not read or write the resized images cache'),
+        click.option('--compositor', default='pil', type=click.Choice(COMPOSITORS),
+                     callback=_check_compositor,
+                     help='Composite collages in a PIL image or in a NumPy array (needs NumPy)'),
+        click.option('--mem-budget', default='512MB', callback=_parse_size_option,
+                     help='Memory kept for decoded images, shared by the viewer and renderer '
+                          '(e.g. 2GB, 0 to disable)'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def encoding_options(func):
+    """Add the options controlling how collages are encoded."""
+    options = [
+        click.option('--quality', '-q', type=click.IntRange(1, 100),
+                     help='JPEG and WebP quality (Pillow default when not given)'),
+        click.option('--subsampling', type=click.Choice(SUBSAMPLINGS),
+                     help='JPEG chroma subsampling'),
+        click.option('--progressive', is_flag=True, help='Write progressive JPEGs'),
+        click.option('--optimize', is_flag=True,
+                     help='Spend more time for smaller JPEG, PNG and WebP files'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def build_save_options(quality, subsampling, progressive, optimize):
+    """Turn the encoding options into keyword arguments of `save_collage`."""
+    return {'quality': quality, 'subsampling': subsampling, 'progressive': progressive,
+            'optimize': optimize}
+
+
+def build_render_options(layout, jobs, downscale, cache_dir, cache_size, no_cache, compositor,
+                         mem_budget):
+    """Turn the shared collage options into keyword arguments of `create_collage`."""
+    cache = None if no_cache else DerivativeCache(cache_dir, cache_size * 1024 * 1024)
+    if mem_budget:
+        # decoded images are kept in memory, in front of the disk cache
+        cache = DecodedImageCache(mem_budget, cache)
+    return {'layout': layout, 'jobs': jobs, 'downscale': downscale, 'cache': cache,
+            'compositor': compositor}
+
+
+def write_collage(images, output, width, height, render_options, stream=False, save_options=None,
+                  plan=None, save_plan=None, widths=None):
+    """
+    Create a collage of `images` and save it to `output` with the `save_options`, without any
+    window. With `stream`, the collage is written band by band instead of being built in memory.
+    A layout `plan` is rendered as is, instead of laying out `images` again, and the plan is
+    written to `save_plan` when given.
+    With `widths`, the collage is made at each width instead of `width`, see `write_collages`.
+    """
+    save_options = save_options or {}
+    options = dict(render_options)
+    layout = options.pop('layout', 'justified')
+    try:
+        if plan is None:
+            plan = plan_collage(images, max(widths) if widths else width, height, layout,
+                                options.get('cache'))
+        if save_plan:
+            plan.save(save_plan)
+        if widths:
+            return write_collages(plan, output, widths, options, save_options)
+        if stream:
+            stream_plan(plan, output, optimize=save_options.get('optimize', False), **options)
+        else:
+            collage_image = render_plan(plan, **options)
+            save_collage(collage_image, output, jobs=options.get('jobs', 1), **save_options)
+    except CollageError as e:
+        click.echo(f"Error: {e}")
+        return False
+    click.echo(f"Collage saved successfully to {output}")
+    return True
+
+
+def output_for_width(output, width):
+    """Return the filename of the `width` wide version of `output`, e.g. collage-800.jpg."""
+    root, ext = os.path.splitext(output)
+    return f'{root}-{width}{ext}'
+
+
+def write_collages(plan, output, widths, render_options, save_options):
+    """
+    Save the collage of `plan` at each of `widths`, as `output_for_width` files. The plan is
+    rescaled to the widths and images are decoded once, for the largest collage.
+    """
+    widths = sorted(widths, reverse=True)
+    plans = [plan if width == plan.width else plan.rescale(width) for width in widths]
+    collage_images = render_plans(plans, **render_options)
+    for width, collage_image in zip(widths, collage_images):
+        filename = output_for_width(output, width)
+        save_collage(collage_image, filename, jobs=render_options.get('jobs', 1), **save_options)
+        click.echo(f"Collage saved successfully to {filename}")
+    return True
+
+
+def _parse_widths_option(ctx, param, value):
+    """Click callback turning '800,1600,3200' into a list of widths."""
+    if value is None:
+        return None
+    try:
+        widths = sorted({int(width) for width in value.split(',') if width.strip()})
+    except ValueError:
+        raise click.BadParameter(f'expected comma separated widths, got {value}')
+    if not widths or widths[0] <= 0:
+        raise click.BadParameter('widths must be positive')
+    return widths
+
+
+def widths_option(func):
+    """Add the option making a collage at several widths."""
+    return click.option(
+        '--widths', callback=_parse_widths_option,
+        help='Comma separated widths, e.g. 800,1600,3200: one layout and one decode for all, '
+             'saved as OUTPUT-WIDTH.EXT, instead of --width (implies --no-viewer)'
+    )(func)
+
+
+def check_widths(widths, stream, memmap=None):
+    """Refuse the options which don't apply to several widths."""
+    if widths and (stream or memmap):
+        raise click.BadParameter(
+            'cannot be combined with --stream or --memmap', param_hint="'--widths'"
+        )
+
+
+def check_stream_output(stream, output, param_hint="'--output'"):
+    """Refuse to stream to a format without a streaming writer."""
+    if stream and os.path.splitext(output)[1].lower() not in STREAM_WRITERS:
+        raise click.BadParameter(
+            f'streaming needs one of {", ".join(sorted(STREAM_WRITERS))}', param_hint=param_hint
+        )
+
+
+def check_output(stream, output, param_hint="'--output'"):
+    """Refuse an output which cannot be written, before any image is decoded."""
+    if stream:
+        check_stream_output(stream, output, param_hint)
+        return
+    try:
+        format_of(output)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint=param_hint)
+
+
+def wait_for_change(watcher, images):
+    """
+    Check the folders of `watcher` until they change. Return the updated order of `images`
+    and the images modified in place.
+    """
+    while True:
+        time.sleep(watcher.interval)
+        change = watcher.check()
+        if change is not None:
+            added, removed, modified = change
+            return update_order(images, added, removed), removed + modified
+
+
+def watch_collage(watcher, images, output, width, height, render_options, save_options,
+                  save_plan=None):
+    """
+    Save the collage of `images`, then save it again each time the folders of `watcher` change,
+    until interrupted. Rows are cached as strips: new images only render the last rows.
+    Images which cannot be read are left out of the collage until they change.
+    """
+    renderer = StripRenderer(**render_options)
+    skipped = set()
+    while True:
+        shown = [img_path for img_path in images if img_path not in skipped]
+        collage_image = None
+        while shown and collage_image is None:
+            try:
+                collage_image = renderer.render(shown, width, height)
+            except ImageSourceError as e:
+                if e.source not in shown:
+                    click.echo(f"Error: {e}")
+                    break
+                click.echo(f"Error: {e}, skipped until it changes")
+                skipped.add(e.source)
+                shown.remove(e.source)
+            except CollageError as e:
+                click.echo(f"Error: {e}")
+                break
+        if collage_image:
+            if save_plan:
+                renderer.plan.save(save_plan)
+            save_collage(collage_image, output, jobs=render_options.get('jobs', 1),
+                         **save_options)
+            click.echo(f"Collage of {len(shown)} images saved to {output} "
+                       f"({renderer.rows_rendered} rows rendered)")
+        elif not shown:
+            click.echo(f"No images left, {output} is kept as is")
+        images, forgotten = wait_for_change(watcher, images)
+        skipped.difference_update(forgotten)
+        renderer.forget(forgotten)
+
+
+def open_viewer(images, output, width, height, render_options, save_options, plan=None,
+                save_plan=None, watcher=None):
+    """Show the collage of `images` in a window, until it is closed."""
+    # pygame is only imported when a window is needed, the headless path starts faster
+    import pygame
+    from .windows import CollageViewer
+
+    # Initialize Pygame
+    pygame.init()
+    viewer=CollageViewer(images, output, width, height, render_options=render_options,
+                         save_options=save_options, plan=plan, save_plan=save_plan,
+                         watcher=watcher)
+    viewer.run()
+
 
 @click.group()
 @click.version_option(version="1.0.0")
@@ -12,26 +295,232 @@ def main():
 @main.command()
 @click.argument('input_folder', type=click.Path(exists=True, file_okay=False, dir_okay=True))
 @click.option('--output', '-o', default='collage.jpg', help='Output filename for the collage')
-@click.option('--width', '-w', default=800, help='Width of the collage')
-@click.option('--height', '-h', default=600, help='Initial height of each image row')
-def make_collage(input_folder, output, width, height):
+@click.option('--no-viewer', is_flag=True, help='Write the collage directly, without opening a window')
+@click.option('--stream', is_flag=True,
+              help='Write the collage row band by row band (PNG, TIFF or raw output), implies --no-viewer')
+@click.option('--profile', type=click.Path(dir_okay=False),
+              help='Write a Chrome trace of the collage pipeline to this JSON file')
+@click.option('--memmap', type=click.Path(dir_okay=False),
+              help='Composite the collage in an array mapped to this file, implies --compositor numpy '
+                   'and --no-viewer')
+@click.option('--save-plan', type=click.Path(dir_okay=False),
+              help='Also write the layout plan to this file, JSON or binary for .bin and .plan '
+                   '(from the viewer, when saving)')
+@click.option('--watch', is_flag=True,
+              help='Keep following the input folder: new images are appended to the collage and '
+                   'removed ones dropped, the collage is written again after each change')
+@click.option('--watch-interval', default=1.0, type=click.FloatRange(min=0.1),
+              help='Seconds between two checks of the watched folder')
+@widths_option
+@discovery_options
+@collage_options
+@encoding_options
+def make_collage(input_folder, output, no_viewer, stream, profile, memmap, save_plan, watch,
+                 watch_interval, widths, recursive, include, exclude, dedupe, width, height,
+                 quality, subsampling, progressive, optimize, **options):
     """Create a collage from images in the input folder."""
-    # Get all image files from the input folder
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff']
-    images = [
-        os.path.join(input_folder, f) 
-        for f in os.listdir(input_folder) 
-        if os.path.splitext(f)[1].lower() in image_extensions
-    ]
- 
-    if not images:
-        click.echo(f"Error: No images found in {input_folder}")
+    check_output(stream, output)
+    check_widths(widths, stream, memmap)
+    if watch and (stream or memmap or widths):
+        raise click.BadParameter(
+            'cannot be combined with --stream, --memmap or --widths', param_hint="'--watch'"
+        )
+    if memmap and (stream or not HAS_NUMPY):
+        raise click.BadParameter(
+            'needs NumPy and cannot be combined with --stream', param_hint="'--memmap'"
+        )
+    tracer = None
+    if profile:
+        tracer = Tracer()
+        set_tracer(tracer)
+    try:
+        watcher = None
+        if watch:
+            watcher = FolderWatcher(
+                [input_folder], recursive, include, exclude, dedupe, watch_interval
+            )
+            images = watcher.scan()
+            if not images:
+                click.echo(f"Waiting for images in {input_folder}...")
+                images, _ = wait_for_change(watcher, images)
+        else:
+            images = find_images(input_folder, recursive, include, exclude, dedupe)
+     
+        if not images:
+            click.echo(f"Error: No images found in {input_folder}")
+            return
+        render_options = build_render_options(**options)
+        save_options = build_save_options(quality, subsampling, progressive, optimize)
+        if watch and no_viewer:
+            watch_collage(watcher, images, output, width, height, render_options, save_options,
+                          save_plan)
+            return
+        if memmap:
+            render_options.update(compositor='numpy', memmap=memmap)
+            no_viewer = True
+        if no_viewer or stream or widths:
+            if not write_collage(images, output, width, height, render_options, stream,
+                                 save_options, save_plan=save_plan, widths=widths):
+                raise SystemExit(1)
+            return
+        open_viewer(images, output, width, height, render_options, save_options,
+                    save_plan=save_plan, watcher=watcher)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tracer is not None:
+            set_tracer(None)
+            tracer.save(profile)
+            click.echo(f"Profile written to {profile}")
+
+
+@main.command('render-plan')
+@click.argument('plan_file', type=click.Path(exists=True, file_okay=True, dir_okay=False))
+@click.option('--output', '-o', default='collage.jpg', help='Output filename for the collage')
+@click.option('--no-viewer', is_flag=True, help='Write the collage directly, without opening a window')
+@click.option('--stream', is_flag=True,
+              help='Write the collage row band by row band (PNG, TIFF or raw output), implies --no-viewer')
+@collage_options
+@encoding_options
+def render_plan_command(plan_file, output, no_viewer, stream, width, height, quality, subsampling,
+                        progressive, optimize, **options):
+    """
+    Render a layout plan saved with --save-plan, without laying out its images again.
+    With --width, the whole plan is rescaled to it. The layout options are ignored.
+    """
+    check_output(stream, output)
+    try:
+        plan = LayoutPlan.load(plan_file)
+    except (ValueError, KeyError, TypeError, struct.error) as e:
+        raise click.BadParameter(f'not a layout plan: {e}', param_hint="'PLAN_FILE'")
+    missing = [img_path for img_path in plan.images if not os.path.isfile(img_path)]
+    if missing:
+        raise click.ClickException(f'{len(missing)} images of the plan are missing, e.g. {missing[0]}')
+    if click.get_current_context().get_parameter_source('width') != ParameterSource.DEFAULT:
+        plan = plan.rescale(width)
+    render_options = build_render_options(**options)
+    render_options['layout'] = plan.engine
+    save_options = build_save_options(quality, subsampling, progressive, optimize)
+    if no_viewer or stream:
+        if not write_collage(plan.images, output, plan.width, plan.row_height, render_options,
+                             stream, save_options, plan=plan):
+            raise SystemExit(1)
         return
-    # Initialize Pygame
-    pygame.init()
-    viewer=CollageViewer(images, output, width, height)
-    viewer.run()
+    open_viewer(plan.images, output, plan.width, plan.row_height, render_options, save_options,
+                plan=plan)
+
+
+def read_manifest(manifest):
+    """
+    Read `(input_folder, output)` pairs from a manifest: one input folder per line, optionally
+    followed by a tab and its output filename. Blank lines and lines starting with # are skipped.
+    """
+    entries = []
+    for line in manifest:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        input_folder, _, output = line.partition('\t')
+        entries.append((input_folder.strip(), output.strip() or None))
+    return entries
+
+
+@main.command()
+@click.argument('input_folders', nargs=-1,
+                type=click.Path(exists=True, file_okay=False, dir_okay=True))
+@click.option('--manifest', '-m', type=click.File('r'),
+              help='File listing input folders, one per line, with an optional tab separated output')
+@click.option('--output-dir', default='.', type=click.Path(file_okay=False, dir_okay=True),
+              help='Directory of the collages of folders without an explicit output')
+@click.option('--format', 'output_format', default='jpg',
+              help='Extension of the collages in the output directory')
+@click.option('--workers', default=2, type=click.IntRange(min=1),
+              help='Number of collages created concurrently')
+@click.option('--stream', is_flag=True,
+              help='Write collages row band by row band (PNG, TIFF or raw output)')
+@widths_option
+@discovery_options
+@collage_options
+@encoding_options
+def batch(input_folders, manifest, output_dir, output_format, workers, stream, widths, recursive,
+          include, exclude, dedupe, width, height, quality, subsampling, progressive, optimize,
+          **options):
+    """Create one collage per input folder, without any window."""
+    entries = [(input_folder, None) for input_folder in input_folders]
+    if manifest is not None:
+        entries.extend(read_manifest(manifest))
+    if not entries:
+        raise click.UsageError('No input folders given')
+    check_widths(widths, stream)
+    check_output(stream, f'collage.{output_format.lstrip(".")}', "'--format'")
+    for _, output in entries:
+        if output is not None:
+            check_output(stream, output, "'--manifest'")
+
+    os.makedirs(output_dir, exist_ok=True)
+    render_options = build_render_options(**options)
+    save_options = build_save_options(quality, subsampling, progressive, optimize)
+
+    def make_one(entry):
+        input_folder, output = entry
+        if output is None:
+            name = os.path.basename(os.path.normpath(input_folder))
+            output = os.path.join(output_dir, f'{name}.{output_format.lstrip(".")}')
+        try:
+            images = find_images(input_folder, recursive, include, exclude, dedupe)
+            if not images:
+                click.echo(f"Error: No images found in {input_folder}")
+                return False
+            return write_collage(images, output, width, height, render_options, stream,
+                                 save_options, widths=widths)
+        except Exception as e:
+            click.echo(f"Error creating collage of {input_folder}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(make_one, entries))
+    if not all(results):
+        raise SystemExit(1)
+
+
+@main.command()
+@click.option('--host', default='127.0.0.1', help='Address the server listens on')
+@click.option('--port', '-p', default=8765, help='Port the server listens on')
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              help='Listen on this Unix socket instead of a TCP port')
+@click.option('--workers', default=2, type=click.IntRange(min=1),
+              help='Number of collages rendered concurrently')
+@collage_options
+@encoding_options
+def serve(host, port, socket_path, workers, width, height, quality, subsampling, progressive,
+          optimize, **options):
+    """Render collages for local clients, keeping layouts and resized images warm."""
+    from .server import CollageService, create_server, remove_socket
+
+    service = CollageService(
+        build_render_options(**options), workers, width, height,
+        build_save_options(quality, subsampling, progressive, optimize),
+    )
+    try:
+        server = create_server(service, host, port, socket_path)
+    except OSError as e:
+        service.close()
+        raise click.ClickException(str(e))
+    click.echo(f"Serving collages on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path is not None:
+            try:
+                remove_socket(socket_path)
+            except OSError as e:
+                # something else took the path meanwhile, it is not ours to remove
+                click.echo(f"Warning: {e}")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -5,80 +5,430 @@ Author: Delimitry
 """
 
 import argparse
+import io
 import os
 import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
 from PIL import Image
 
+from .canvas import COMPOSITORS, HAS_NUMPY, ArrayCanvas, canvas_array
+from .encode import format_of, normalize_format, save_image
+from .errors import EmptyCollageError, NoImagesError
+from .imaging import load_resized, open_source, paste_tile, read_image_size, resize_image
+from .layout import MARGIN_SIZE
+from .plan import LayoutPlan
+from .profiling import count, span
+from .stream import open_stream_writer
+from .worker import CollageCancelled
 
-def create_collage(images, width, init_height):
+BACKGROUND_COLOR = (35, 35, 35)
+# drafts of progressive renders are this many times narrower than the collage
+DRAFT_SCALE = 4
+
+
+def read_image_sizes(images, cache=None):
+    """
+    Read the dimensions of `images` from their headers, without decoding pixel data.
+    """
+    with span('read_sizes', images=len(images)):
+        sizes = [read_image_size(img_path, cache) for img_path in images]
+        if cache is not None:
+            cache.flush()
+    return sizes
+
+
+def _map_ordered(func, items, jobs):
+    """
+    Yield `func(*item)` for each of `items`, in order, running up to `jobs` calls in threads.
+    Pillow releases the GIL while decoding and resampling, so threads scale across cores.
+    """
+    if jobs <= 1:
+        for item in items:
+            yield func(*item)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # bound the number of pending results, so decoded tiles don't pile up in memory
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, *item))
+                if len(pending) >= jobs * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # when the consumer stops early, don't wait for tiles nobody will paste
+            for future in pending:
+                future.cancel()
+
+
+def _iter_tiles(images, rows, jobs, downscale, cache):
     """
-    Make a collage image with a width equal to `width` from `images` and save to `filename`.
+    Yield `(row_index, img, (x, y))` for every image of the `rows` layout, in order.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    tiles = [
+        (row_index, images[index], (box_width, height), (x, y))
+        for row_index, (y, height, boxes) in enumerate(rows)
+        for index, x, box_width in boxes
+    ]
+    resized = _map_ordered(
+        load_resized, [(img_path, size, downscale, cache) for _, img_path, size, _ in tiles], jobs
+    )
+    for (row_index, _, _, position), img in zip(tiles, resized):
+        yield row_index, img, position
+
+
+def composite(tiles, width, height, compositor='pil', memmap=None):
+    """
+    Paste the `(img, position)` `tiles`, in order, into a new `width` x `height` collage image.
+    The 'pil' compositor pastes into a PIL canvas, the 'numpy' one into a preallocated array,
+    memory-mapped to the `memmap` file when given, which the returned image shares.
+    """
+    canvas = _new_canvas(width, height, compositor, memmap)
+    for img, position in tiles:
+        canvas = _paste(canvas, img, position)
+    return _finish(canvas)
+
+
+def _new_canvas(width, height, compositor='pil', memmap=None):
+    """Return an empty canvas of the `compositor`, see `composite`."""
+    if compositor not in COMPOSITORS:
+        raise ValueError(f'Unknown compositor: {compositor}')
+    if compositor == 'numpy':
+        return ArrayCanvas(width, height, BACKGROUND_COLOR, filename=memmap)
+    # the collage stays RGB, unless an image brings transparency
+    return Image.new('RGB', (width, height), BACKGROUND_COLOR)
+
+
+def _paste(canvas, img, position):
+    """Paste `img` into a canvas of `_new_canvas`, return the canvas, possibly a new one."""
+    if isinstance(canvas, ArrayCanvas):
+        canvas.paste(img, position)
+        return canvas
+    return paste_tile(canvas, img, position)
+
+
+def _finish(canvas):
+    """Return the collage image of a canvas of `_new_canvas`."""
+    return canvas.to_image() if isinstance(canvas, ArrayCanvas) else canvas
+
+
+def create_collage(images, width, init_height, layout='justified', jobs=1, downscale='balanced',
+                   cache=None, compositor='pil', memmap=None):
+    """
+    Make a collage image with a width equal to `width` from `images`.
+    The collage is RGB, or RGBA when an image has transparency. Rows target a height of
+    `init_height` and are split by the `layout` engine.
+    `images` are paths, bytes-like objects, binary file objects or PIL images, in any mix,
+    see `plan_collage`. Pixels are decoded once, at the size of the tile of each image.
+    See `encode_collage` and `collage_array` to get the collage as an encoded buffer or as
+    an array.
+    Images are decoded and resampled by `jobs` threads (0 for one per CPU core), with the
+    `downscale` quality/speed trade-off. Sizes and resized images of paths are reused from the
+    `cache` derivative cache, when given. See `composite` for `compositor` and `memmap`.
+    Raise `NoImagesError`, `EmptyCollageError` or `ImageSourceError` when there is no collage.
+    """
+    with span('create_collage', images=len(images), width=width):
+        plan = plan_collage(images, width, init_height, layout, cache)
+        return render_plan(plan, jobs, downscale, cache, compositor, memmap)
+
+
+def plan_collage(images, width, init_height, layout='justified', cache=None):
+    """
+    Return the `LayoutPlan` of the collage `create_collage` would make. Only image headers
+    are read, pixels are decoded once the plan is rendered.
+    In-memory `images` are read once and become `SourceImage`s of the plan, which can be
+    rendered any number of times.
+    Raise `NoImagesError`, `EmptyCollageError` or `ImageSourceError` when there is no collage.
     """
     if not images:
-        print('No images for collage found!')
-        return False
-
-    margin_size = 2
-    # run until a suitable arrangement of images is found
-    while True:
-        # copy images to images_list
-        images_list = images[:]
-        coefs_lines = []
-        images_line = []
-        x = 0
-        while images_list:
-            # get first image and resize to `init_height`
-            img_path = images_list.pop(0)
-
-            img = Image.open(img_path)
-            img.thumbnail((width, init_height))
-            # when `x` will go beyond the `width`, start the next line
-            if x > width:
-                coefs_lines.append((float(x) / width, images_line))
-                images_line = []
-                x = 0
-            x += img.size[0] + margin_size
-            images_line.append(img_path)
-        # finally add the last line with images
-        coefs_lines.append((float(x) / width, images_line))
-        
-
-        # compact the lines, by reducing the `init_height`, if any with one or less images
-        if len(coefs_lines) <= 1:
-            break
-        if any(map(lambda c: len(c[1]) <= 1, coefs_lines)):
-            # reduce `init_height`
-            init_height -= 10
-        else:
-            break
-
-    # get output height
-    out_height = 0
-    for coef, imgs_line in coefs_lines:
-        if imgs_line:
-            out_height += int(init_height / coef) + margin_size
-    if not out_height:
-        print('Height of collage could not be 0!')
-        return False
-
-    collage_image = Image.new('RGBA', (width, int(out_height)), (35, 35, 35))
-    # put images to the collage 
-    y = 0
-    for coef, imgs_line in coefs_lines:
-        if imgs_line:
-            x = 0
-            for img_path in imgs_line:
-                img = Image.open(img_path)
-                # if need to enlarge an image - use `resize`, otherwise use `thumbnail`, it's faster
-                k = (init_height / coef) / img.size[1]
-                if k > 1:
-                    img = img.resize((int(img.size[0] * k), int(img.size[1] * k)), Image.LANCZOS)
-                else:
-                    img.thumbnail((int(width / coef), int(init_height / coef)), Image.LANCZOS)
-                if collage_image:
-                    collage_image.paste(img, (int(x), int(y)))
-                x += img.size[0] + margin_size
-            y += int(init_height / coef) + margin_size
-    
-    return collage_image
+        raise NoImagesError('No images for collage found!')
+
+    images = [open_source(source) for source in images]
+    sizes = read_image_sizes(images, cache)
+    plan = LayoutPlan.build(images, sizes, width, init_height, layout)
+    if not plan.height:
+        raise EmptyCollageError('Height of collage could not be 0!')
+    return plan
+
+
+def render_plan(plan, jobs=1, downscale='balanced', cache=None, compositor='pil', memmap=None):
+    """
+    Make the collage of a `LayoutPlan`, without laying out its images again.
+    See `create_collage` for the other arguments.
+    """
+    return render_collage(
+        plan.images, plan.rows, plan.width, plan.height, jobs, downscale, cache, compositor, memmap
+    )
+
+
+def render_collage(images, rows, width, out_height, jobs=1, downscale='balanced', cache=None,
+                   compositor='pil', memmap=None):
+    """
+    Paste `images` into a collage following the `rows` layout from `compute_layout`.
+    """
+    with span('render', rows=len(rows)):
+        # put images to the collage, tiles are prepared in parallel but pasted in order
+        tiles = (
+            (img, position)
+            for _, img, position in _iter_tiles(images, rows, jobs, downscale, cache)
+        )
+        return composite(tiles, width, int(out_height), compositor, memmap)
+
+
+def _load_tile_sizes(img_path, sizes, downscale, cache):
+    """
+    Decode the image at `img_path` once at the first of `sizes`, and resample it to the others.
+    """
+    img = load_resized(img_path, sizes[0], downscale, cache)
+    with span('resample'):
+        return [img] + [resize_image(img, size, downscale) for size in sizes[1:]]
+
+
+def render_plans(plans, jobs=1, downscale='balanced', cache=None, compositor='pil'):
+    """
+    Make the collages of `plans` of the same images and lines, e.g. a plan and its
+    `LayoutPlan.rescale`d copies, the largest first. Each image is decoded once, at its size
+    in the largest collage. With the 'fast' `downscale` the smaller collages are shrunk from
+    the largest one, otherwise each tile is resampled to its size in every collage.
+    Return the collage images, in the order of `plans`.
+    """
+    largest = plans[0]
+    if downscale == 'fast':
+        collage_image = render_plan(largest, jobs, downscale, cache, compositor)
+        with span('resample', collages=len(plans) - 1):
+            return [collage_image] + [
+                collage_image.resize((plan.width, int(plan.height)), Image.BILINEAR, reducing_gap=2.0)
+                for plan in plans[1:]
+            ]
+
+    with span('render', rows=len(largest.rows), collages=len(plans)):
+        jobs = jobs or os.cpu_count() or 1
+        order = [index for _, _, boxes in largest.rows for index, _, _ in boxes]
+        boxes = [[plan.box_of(index) for plan in plans] for index in order]
+        tile_sets = _map_ordered(
+            _load_tile_sizes,
+            [
+                (largest.images[index], [(w, h) for _, _, w, h in image_boxes], downscale, cache)
+                for index, image_boxes in zip(order, boxes)
+            ],
+            jobs,
+        )
+        canvases = [_new_canvas(plan.width, int(plan.height), compositor) for plan in plans]
+        # tiles are prepared in parallel but pasted in order
+        for image_boxes, tiles in zip(boxes, tile_sets):
+            for i, ((x, y, _, _), img) in enumerate(zip(image_boxes, tiles)):
+                canvases[i] = _paste(canvases[i], img, (x, y))
+        return [_finish(canvas) for canvas in canvases]
+
+
+class StripRenderer:
+    def __init__(self, layout='justified', jobs=1, downscale='balanced', cache=None,
+                 compositor='pil'):
+        """
+        Render collages as cached strips, one per row, so that a new order, an insertion or a
+        removal only re-renders the rows whose images or scale changed.
+
+        :param layout: Layout engine used to split images into rows
+        :param jobs: Number of threads decoding images (0 for one per CPU core)
+        :param downscale: Quality/speed trade-off when shrinking images
+        :param cache: Optional derivative cache
+        :param compositor: How strips are assembled into collages, see `composite`
+        """
+        self.layout = layout
+        self.jobs = jobs
+        self.downscale = downscale
+        self.cache = cache
+        self.compositor = compositor
+        self.sizes = {}
+        self.strips = {}
+        self.rows_rendered = 0
+        # plan of the last collage, reused while its images and size don't change
+        self.plan = None
+        self._forgotten = set()
+        self._lock = threading.Lock()
+
+    def forget(self, images):
+        """
+        Drop what is known about `images`, after they changed on disk. It is safe to call while
+        a render runs in another thread: the images are dropped when the next render starts.
+        """
+        with self._lock:
+            self._forgotten.update(images)
+
+    def _drop_forgotten(self):
+        """Drop what is known about the images passed to `forget`."""
+        with self._lock:
+            images, self._forgotten = self._forgotten, set()
+        if not images:
+            return
+        for img_path in images:
+            self.sizes.pop(img_path, None)
+        self.strips = {
+            key: strip for key, strip in self.strips.items()
+            if not images.intersection(img_path for img_path, _, _ in key[2])
+        }
+        if self.plan is not None and images.intersection(self.plan.images):
+            self.plan = None
+
+    def render(self, images, width, init_height, should_cancel=None, progress=None):
+        """
+        Make the collage of `images`, like `create_collage`, reusing the strips of unchanged rows.
+        `should_cancel` is called between tiles, the render raises `CollageCancelled` once it
+        returns True. Strips are only kept from renders which complete.
+
+        `progress` is called with what is known of the collage before it is done, in order:
+        `('plan', plan)` once laid out, `('draft', image)` with a smaller collage made from
+        draft decodes when rows must be rendered, then `('tile', (img, (x, y)))` for each
+        image rendered at full quality.
+        Raise `NoImagesError` or `EmptyCollageError` when there is no collage.
+        """
+        if not images:
+            raise NoImagesError('No images for collage found!')
+
+        with span('strips.render', images=len(images), width=width):
+            return self._render(images, width, init_height, should_cancel, progress)
+
+    def _render_draft(self, plan, should_cancel):
+        """Make a `DRAFT_SCALE` times smaller collage of `plan` quickly, see `render`."""
+        with span('strips.draft', images=len(plan.images)):
+            draft = plan.rescale(max(plan.width // DRAFT_SCALE, 1))
+            # images of tiny drafts may shrink to nothing
+            rows = [
+                (y, height, [box for box in boxes if box[2] > 0])
+                for y, height, boxes in draft.rows if height > 0
+            ]
+            canvas = _new_canvas(draft.width, max(int(draft.height), 1))
+            for _, img, position in _iter_tiles(draft.images, rows, self.jobs, 'fast', None):
+                if should_cancel is not None and should_cancel():
+                    raise CollageCancelled()
+                canvas = _paste(canvas, img, position)
+            return _finish(canvas)
+
+    def _render(self, images, width, init_height, should_cancel, progress=None):
+        """Make the collage of `images`, see `render`."""
+        self._drop_forgotten()
+        plan = self.plan
+        if (plan is None or plan.images != images or plan.width != width
+                or int(plan.row_height) != int(init_height) or plan.engine != self.layout):
+            missing = [img_path for img_path in images if img_path not in self.sizes]
+            self.sizes.update(zip(missing, read_image_sizes(missing, self.cache)))
+            sizes = [self.sizes[img_path] for img_path in images]
+            plan = LayoutPlan.build(images, sizes, width, init_height, self.layout)
+        rows, out_height = plan.rows, plan.height
+        if not out_height:
+            raise EmptyCollageError('Height of collage could not be 0!')
+
+        # a row is identified by the collage width, its height and the boxes of its images
+        keys = [
+            (width, height, tuple((images[index], x, box_width) for index, x, box_width in boxes))
+            for y, height, boxes in rows
+        ]
+        strips = {key: self.strips[key] for key in keys if key in self.strips}
+        dirty = [row_index for row_index, key in enumerate(keys) if key not in strips]
+        dirty_rows = [(0, rows[row_index][1], rows[row_index][2]) for row_index in dirty]
+        if progress is not None:
+            progress('plan', plan)
+            if dirty:
+                progress('draft', self._render_draft(plan, should_cancel))
+        for dirty_index, img, position in _iter_tiles(
+            images, dirty_rows, self.jobs, self.downscale, self.cache
+        ):
+            if should_cancel is not None and should_cancel():
+                raise CollageCancelled()
+            key = keys[dirty[dirty_index]]
+            if key not in strips:
+                strips[key] = Image.new('RGB', (width, key[1]), BACKGROUND_COLOR)
+            strips[key] = paste_tile(strips[key], img, position)
+            if progress is not None:
+                progress('tile', (img, (position[0], rows[dirty[dirty_index]][0])))
+        # only keep the strips and the plan of the current collage
+        self.strips = strips
+        self.plan = plan
+        self.rows_rendered = len(dirty)
+        count('strips.rendered', len(dirty))
+        count('strips.reused', len(keys) - len(dirty))
+
+        tiles = [(strips[key], (0, y)) for (y, _, _), key in zip(rows, keys)]
+        return composite(tiles, width, int(out_height), self.compositor)
+
+
+def stream_collage(images, output, width, init_height, layout='justified', jobs=1,
+                   downscale='balanced', cache=None, compositor='pil', optimize=False):
+    """
+    Make the same collage as `create_collage`, in RGB, and write it to `output` one row band
+    at a time, so memory is bounded by the tallest row instead of the whole image.
+    `output` must be a PNG, TIFF or raw (.raw, with a .json sidecar) filename. PNG bands are
+    compressed by the `jobs` threads, harder with `optimize`.
+    """
+    plan = plan_collage(images, width, init_height, layout, cache)
+    return stream_plan(plan, output, jobs, downscale, cache, compositor, optimize)
+
+
+def stream_plan(plan, output, jobs=1, downscale='balanced', cache=None, compositor='pil',
+                optimize=False):
+    """
+    Write the collage of a `LayoutPlan` like `stream_collage`, without laying out its images again.
+    """
+    images, rows, width, out_height = plan.images, plan.rows, plan.width, plan.height
+    writer = open_stream_writer(
+        output, width, int(out_height), 'RGB', 9 if optimize else 6, jobs or os.cpu_count() or 1
+    )
+    try:
+        tiles = _iter_tiles(images, rows, jobs, downscale, cache)
+        for row_index, row_tiles in groupby(tiles, key=lambda tile: tile[0]):
+            band_y, band_height, _ = rows[row_index]
+            # each band holds a row and the margin below it
+            band = composite(
+                ((img, (x, y - band_y)) for _, img, (x, y) in row_tiles),
+                width, band_height + MARGIN_SIZE, compositor,
+            )
+            if band.mode != 'RGB':
+                band = band.convert('RGB')
+            with span('encode'):
+                writer.write(band)
+    finally:
+        with span('encode'):
+            writer.close()
+    return True
+
+
+def save_collage(collage_image, filename, image_format=None, jobs=1, **options):
+    """
+    Save `collage_image` to `filename`, dropping the alpha channel for formats without one.
+    `filename` may be a file object, `image_format` is then required instead of the extension.
+    `options` are the quality options of `encoder_params`, large PNG files are compressed by
+    `jobs` threads (0 for one per CPU core).
+    """
+    image_format = format_of(filename) if image_format is None else normalize_format(image_format)
+    save_image(collage_image, filename, image_format, jobs, **options)
+
+
+def encode_collage(collage_image, image_format='jpeg', jobs=1, **options):
+    """
+    Return `collage_image` encoded in `image_format`, see `save_collage` for the other arguments.
+    The encoder writes into a single buffer, returned as a memoryview over it, without a copy.
+    """
+    buffer = io.BytesIO()
+    save_collage(collage_image, buffer, image_format, jobs, **options)
+    return buffer.getbuffer()
+
+
+def collage_array(collage_image):
+    """
+    Return the pixels of `collage_image` as a `(height, width, channels)` uint8 NumPy array.
+    Collages of the 'numpy' compositor are returned as the array they were composited into,
+    without any copy, opaque ones as a view without the padding channel.
+    """
+    array = canvas_array(collage_image)
+    if array is not None:
+        return array[..., :3] if collage_image.mode == 'RGBX' else array
+    if not HAS_NUMPY:
+        raise ImportError('Collage arrays need NumPy: pip install numpy')
+    import numpy as np
 
+    return np.asarray(collage_image)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Image discovery - walk folders in parallel, recognize images by content, skip duplicates
+"""
+
+import fnmatch
+import hashlib
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from .profiling import count, span
+
+# leading bytes of the supported formats, as (offset, signature)
+IMAGE_SIGNATURES = (
+    (0, b'\xff\xd8\xff'),            # JPEG
+    (0, b'\x89PNG\r\n\x1a\n'),       # PNG
+    (0, b'GIF87a'),                  # GIF
+    (0, b'GIF89a'),
+    (0, b'BM'),                      # BMP
+    (0, b'II*\x00'),                 # TIFF, little endian
+    (0, b'MM\x00*'),                 # TIFF, big endian
+    (8, b'WEBP'),                    # WebP, in a RIFF container
+)
+# the 'BM' magic of BMP is weak, the reserved bytes and the size of the info header
+# which follow it are checked too
+BMP_INFO_HEADER_SIZES = (12, 40, 52, 56, 64, 108, 124)
+SNIFF_SIZE = 18
+# bytes hashed at each end of a file before comparing whole files
+PARTIAL_HASH_SIZE = 64 * 1024
+
+
+def is_image(path):
+    """
+    Tell if the file at `path` is an image, from its first bytes whatever its extension.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(SNIFF_SIZE)
+    except OSError:
+        return False
+    if head[8:12] == b'WEBP' and not head.startswith(b'RIFF'):
+        return False
+    if head.startswith(b'BM'):
+        return (len(head) == SNIFF_SIZE and head[6:10] == b'\0\0\0\0'
+                and struct.unpack('<I', head[14:18])[0] in BMP_INFO_HEADER_SIZES)
+    return any(head[offset:offset + len(signature)] == signature
+               for offset, signature in IMAGE_SIGNATURES)
+
+
+def _matches(rel_path, patterns):
+    """Tell if `rel_path`, or its file name, matches one of the glob `patterns`."""
+    name = os.path.basename(rel_path)
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern)
+               for pattern in patterns)
+
+
+def _scan_directory(root, directory, recursive, include, exclude, sniff=True):
+    """
+    List one directory: return its images as `(path, size, mtime_ns)` and its subdirectories
+    to walk as `(path, (st_dev, st_ino))`. Without `sniff`, all its files are returned, images
+    or not.
+    """
+    images = []
+    subdirectories = []
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return images, subdirectories
+    for entry in entries:
+        rel_path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+        if exclude and _matches(rel_path, exclude):
+            continue
+        try:
+            if entry.is_dir():
+                if recursive:
+                    # symbolic links are followed, the walk skips directories seen already
+                    stat = entry.stat()
+                    subdirectories.append((entry.path, (stat.st_dev, stat.st_ino)))
+                continue
+            if not entry.is_file():
+                continue
+        except OSError:
+            continue
+        if include and not _matches(rel_path, include):
+            continue
+        count('discovery.files')
+        if not sniff or is_image(entry.path):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            images.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return images, subdirectories
+
+
+def walk_images(roots, recursive=False, include=(), exclude=(), jobs=8):
+    """
+    Return the `(path, size)` of the images under `roots`, sorted by path.
+    Directories are listed and files sniffed by `jobs` threads.
+
+    :param roots: Folders to search
+    :param recursive: Also search the subfolders
+    :param include: Glob patterns a file must match, on its path relative to its root or its name
+    :param exclude: Glob patterns of files and folders to skip
+    :param jobs: Number of threads
+    """
+    return [(path, size) for path, size, _ in _walk(roots, recursive, include, exclude, jobs)]
+
+
+def list_files(roots, recursive=False, include=(), exclude=(), jobs=8):
+    """
+    Return the `(size, mtime_ns)` of the files under `roots` by path, images or not, without
+    reading them. See `walk_images` for the arguments.
+    """
+    return {
+        path: (size, mtime_ns)
+        for path, size, mtime_ns in _walk(roots, recursive, include, exclude, jobs, sniff=False)
+    }
+
+
+def _walk(roots, recursive, include, exclude, jobs, sniff=True):
+    """Return the `(path, size, mtime_ns)` of the files of `walk_images`, sorted by path."""
+    images = []
+    # (st_dev, st_ino) of the directories listed, symbolic links may lead back to them
+    visited = set()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        pending = []
+        pending_roots = []
+        for root in roots:
+            try:
+                stat = os.stat(root)
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) in visited:
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+            pending.append(executor.submit(
+                _scan_directory, root, root, recursive, include, exclude, sniff
+            ))
+            pending_roots.append(root)
+        while pending:
+            future = pending.pop()
+            root = pending_roots.pop()
+            found, subdirectories = future.result()
+            images.extend(found)
+            for subdirectory, key in subdirectories:
+                if key in visited:
+                    continue
+                visited.add(key)
+                pending.append(executor.submit(
+                    _scan_directory, root, subdirectory, recursive, include, exclude, sniff
+                ))
+                pending_roots.append(root)
+    images.sort()
+    return images
+
+
+def _hash_file(path, partial=False):
+    """Return a hash of the file at `path`, or of both its ends only with `partial`."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        if partial:
+            digest.update(f.read(PARTIAL_HASH_SIZE))
+            f.seek(max(0, os.fstat(f.fileno()).st_size - PARTIAL_HASH_SIZE))
+            digest.update(f.read(PARTIAL_HASH_SIZE))
+        else:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.digest()
+
+
+def _group_by(items, key, executor):
+    """Group `items` sharing a `key` computed in `executor`, return groups of 2 or more."""
+    groups = {}
+    for item, value in zip(items, executor.map(key, items)):
+        groups.setdefault(value, []).append(item)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def drop_duplicates(images, jobs=8):
+    """
+    Return the paths of `images`, `(path, size)` pairs, without exact duplicates.
+    Only files of the same size are hashed, first on both ends, then fully when these match.
+    The first path of each set of duplicates is kept.
+    """
+    by_size = {}
+    for path, size in images:
+        by_size.setdefault(size, []).append(path)
+    duplicates = set()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for same_size in by_size.values():
+            if len(same_size) < 2:
+                continue
+            for same_ends in _group_by(same_size, lambda path: _hash_file(path, True), executor):
+                for same in _group_by(same_ends, _hash_file, executor):
+                    duplicates.update(same[1:])
+    count('discovery.duplicates', len(duplicates))
+    return [path for path, _ in images if path not in duplicates]
+
+
+def discover_images(roots, recursive=False, include=(), exclude=(), dedupe=False, jobs=8):
+    """
+    Return the paths of the images under `roots`, recognized by content, sorted by path.
+    With `dedupe`, exact duplicates are dropped. See `walk_images` for the other arguments.
+    """
+    with span('discovery', roots=len(roots)):
+        images = walk_images(roots, recursive, include, exclude, jobs)
+        if dedupe:
+            return drop_duplicates(images, jobs)
+        return [path for path, _ in images]
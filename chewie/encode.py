@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Encoding - save collages with Pillow, with format specific quality options
+"""
+
+import os
+from PIL import Image
+
+from .canvas import canvas_array
+from .profiling import span
+from .stream import PngStreamWriter
+
+# chroma subsampling of JPEG outputs, from sharpest to smallest
+SUBSAMPLINGS = ('4:4:4', '4:2:2', '4:2:0')
+# formats without an alpha channel
+OPAQUE_FORMATS = ('JPEG', 'BMP')
+# formats Pillow writes from RGBX images directly, others need them converted to RGB
+RGBX_FORMATS = ('JPEG', 'WEBP')
+# PNG collages from this many pixels are compressed band by band in parallel
+PARALLEL_PNG_PIXELS = 16 * 1024 * 1024
+# rows of the bands compressed in parallel
+PNG_BAND_ROWS = 256
+
+
+def normalize_format(image_format):
+    """Return the Pillow name of `image_format` (e.g. 'jpg' -> 'JPEG'), if Pillow can write it."""
+    image_format = image_format.upper().lstrip('.')
+    image_format = {'JPG': 'JPEG', 'TIF': 'TIFF'}.get(image_format, image_format)
+    Image.init()
+    if image_format not in Image.SAVE:
+        raise ValueError(f'Unsupported format: {image_format.lower()}')
+    return image_format
+
+
+def format_of(filename):
+    """Return the Pillow name of the format of `filename`, from its extension."""
+    ext = os.path.splitext(filename)[1]
+    if not ext:
+        raise ValueError(f'Cannot tell the format of {filename}, it has no extension')
+    return normalize_format(ext)
+
+
+def encoder_params(image_format, quality=None, subsampling=None, progressive=False,
+                   optimize=False):
+    """
+    Return the keyword arguments of `Image.save` for these options, those which don't
+    apply to `image_format` are left out.
+
+    :param image_format: Pillow format name
+    :param quality: JPEG and WebP quality, from 1 to 100
+    :param subsampling: JPEG chroma subsampling, one of `SUBSAMPLINGS`
+    :param progressive: Write progressive JPEGs
+    :param optimize: Spend more time for smaller JPEG, PNG and WebP files
+    """
+    params = {}
+    if image_format == 'JPEG':
+        if quality is not None:
+            params['quality'] = quality
+        if subsampling is not None:
+            params['subsampling'] = subsampling
+        if progressive:
+            params['progressive'] = True
+        if optimize:
+            params['optimize'] = True
+    elif image_format == 'WEBP':
+        if quality is not None:
+            params['quality'] = quality
+        if optimize:
+            params['method'] = 6
+    elif image_format == 'PNG':
+        if optimize:
+            params['optimize'] = True
+    return params
+
+
+def save_png_bands(image, filename, compress_level=6, jobs=1):
+    """
+    Save `image` as a PNG compressed band by band with `jobs` threads.
+    Collages composited into an array are read from it band by band, RGBA ones without any copy.
+    """
+    width, height = image.size
+    array = canvas_array(image)
+    mode = 'RGB' if image.mode == 'RGBX' else image.mode
+    writer = PngStreamWriter(filename, width, height, mode, compress_level, jobs)
+    try:
+        for y in range(0, height, PNG_BAND_ROWS):
+            rows = min(PNG_BAND_ROWS, height - y)
+            if array is not None and image.mode == 'RGBX':
+                # drop the padding of the band only
+                data = array[y:y + rows, :, :3].tobytes()
+            elif array is not None:
+                data = memoryview(array[y:y + rows]).cast('B')
+            else:
+                data = image.crop((0, y, width, y + rows)).tobytes()
+            writer.write_rows(data, rows)
+    finally:
+        writer.close()
+
+
+def save_image(image, filename, image_format, jobs=1, **options):
+    """
+    Save `image` to `filename`, a filename or a file object, in the Pillow `image_format`
+    with the `encoder_params` `options`. Large PNG files are compressed with `jobs` threads,
+    like PNG files of RGBX array collages, which are not copied to RGB as a whole.
+    """
+    if image.mode == 'RGBA' and image_format in OPAQUE_FORMATS:
+        image = image.convert('RGB')
+    jobs = jobs or os.cpu_count() or 1
+    array_collage = canvas_array(image) is not None and image.mode == 'RGBX'
+    if image.mode == 'RGBX' and image_format not in RGBX_FORMATS and not (
+            image_format == 'PNG' and array_collage and isinstance(filename, str)):
+        image = image.convert('RGB')
+    with span('encode', format=image_format):
+        if (image_format == 'PNG' and isinstance(filename, str)
+                and image.mode in ('RGB', 'RGBA', 'RGBX')
+                and (array_collage or jobs > 1
+                     and image.size[0] * image.size[1] >= PARALLEL_PNG_PIXELS)):
+            compress_level = 9 if options.get('optimize') else 6
+            save_png_bands(image, filename, compress_level, jobs)
+        else:
+            image.save(filename, image_format, **encoder_params(image_format, **options))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Errors - raised when a collage cannot be made
+"""
+
+
+class CollageError(Exception):
+    """Base class of the errors raised when a collage cannot be made."""
+
+
+class NoImagesError(CollageError):
+    """Raised when a collage is requested without any image."""
+
+
+class EmptyCollageError(CollageError):
+    """Raised when the layout of a collage has no height."""
+
+
+class ImageSourceError(CollageError):
+    """Raised when an image source cannot be opened or decoded."""
+
+    def __init__(self, message, source=None):
+        super().__init__(message)
+        self.source = source
+
+
+class PlanError(CollageError):
+    """Raised when a layout plan cannot be saved, e.g. a plan of in-memory images."""
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Font cache - share fonts and rendered text surfaces between widgets and frames
+"""
+
+from collections import OrderedDict
+import pygame
+
+# number of rendered text surfaces kept, least recently used ones are dropped first
+MAX_TEXT_SURFACES = 1024
+
+_fonts = {}
+_text_surfaces = OrderedDict()
+
+
+def clear_cache():
+    """Drop the cached fonts and text surfaces, they are invalid once pygame quits."""
+    _fonts.clear()
+    _text_surfaces.clear()
+
+
+pygame.register_quit(clear_cache)
+
+
+def get_font(size):
+    """Return the default font at `size`, loaded once."""
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.Font(None, size)
+    return font
+
+
+def render_text(text, size, color, antialias=True):
+    """
+    Return a surface with `text` rendered in the default font at `size`.
+    Surfaces are cached, so static labels are rendered once and not on every frame.
+    """
+    key = (text, size, tuple(color), antialias)
+    surface = _text_surfaces.get(key)
+    if surface is not None:
+        _text_surfaces.move_to_end(key)
+        return surface
+    surface = get_font(size).render(text, antialias, color)
+    _text_surfaces[key] = surface
+    if len(_text_surfaces) > MAX_TEXT_SURFACES:
+        _text_surfaces.popitem(last=False)
+    return surface
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Imaging helpers - decode images close to the size they are displayed at
+"""
+
+import io
+import os
+import threading
+from PIL import Image
+
+from .errors import ImageSourceError
+from .layout import fit_size
+from .profiling import count, span
+
+_copy_lock = threading.Lock()
+
+# quality/speed trade-offs of `resize_image`, from fastest to best looking
+DOWNSCALE_MODES = ('fast', 'balanced', 'best')
+
+
+def resize_image(img, size, downscale='balanced'):
+    """
+    Resample the not yet loaded `img` to `size`.
+
+    :param img: Image freshly returned by `Image.open`
+    :param size: Target (width, height)
+    :param downscale: One of `DOWNSCALE_MODES`:
+        'fast' lets the JPEG decoder shrink to the nearest scale above `size`, then uses bilinear;
+        'balanced' decodes at twice `size` at least, then reduces and finishes with LANCZOS;
+        'best' decodes at full resolution and uses LANCZOS.
+    """
+    if downscale not in DOWNSCALE_MODES:
+        raise ValueError(f'Unknown downscale mode: {downscale}')
+    if downscale == 'fast':
+        # JPEG draft mode decodes directly at 1/2, 1/4 or 1/8 scale, a no-op for other formats
+        img.draft(None, size)
+        resample, reducing_gap = Image.BILINEAR, 1.0
+    elif downscale == 'balanced':
+        # keep a 2x margin for the final filter, `reduce` does the cheap part of the work
+        img.draft(None, (size[0] * 2, size[1] * 2))
+        resample, reducing_gap = Image.LANCZOS, 3.0
+    else:
+        resample, reducing_gap = Image.LANCZOS, None
+    with span('decode'):
+        img.load()
+        img = _convert_palette(img)
+    with span('resample'):
+        return img.resize(size, resample, reducing_gap=reducing_gap)
+
+
+def has_alpha(img):
+    """
+    Tell if `img` has transparent pixels, once palettes are converted. Alpha channels which
+    are fully opaque, common in PNG files, don't count: they would make whole collages RGBA.
+    """
+    if img.mode not in ('RGBA', 'RGBa', 'LA', 'La', 'PA'):
+        return False
+    # the alpha channel is the last band
+    return img.getextrema()[-1][0] < 255
+
+
+def paste_tile(canvas, img, position):
+    """
+    Paste `img` into `canvas` at `position`. Canvases are RGB until a tile with an alpha
+    channel comes, then they are switched to RGBA. Return the canvas, possibly a new one.
+    """
+    with span('paste'):
+        if canvas.mode == 'RGB' and has_alpha(img):
+            canvas = canvas.convert('RGBA')
+        canvas.paste(img, position)
+    return canvas
+
+
+def _convert_palette(img):
+    """
+    Convert palette and bilevel images, which Pillow can only resample with NEAREST.
+    """
+    if img.mode in ('P', '1'):
+        return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    return img
+
+
+class SourceImage:
+    def __init__(self, source):
+        """
+        Image of an in-memory `source`, read once: bytes-like objects are used as they are, file
+        objects are read from their start. Its header is parsed at once, its pixels each time it
+        is decoded, so the plans it is part of can be rendered again. PIL images are never
+        changed: they are copied before being decoded.
+
+        :param source: Bytes-like object, binary file object, or PIL image
+        """
+        self.source = source
+        if isinstance(source, Image.Image):
+            self.data = None
+            self.size = source.size
+            return
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.data = source
+        else:
+            try:
+                if source.seekable():
+                    # like `Image.open`, and so that the same file object can be given twice
+                    source.seek(0)
+                self.data = source.read()
+            except (AttributeError, OSError, ValueError) as e:
+                raise ImageSourceError(f'Cannot read image: {e}', source) from e
+        with self._open() as img:
+            self.size = img.size
+
+    def _open(self):
+        """Open the image of the source data lazily."""
+        try:
+            # `BytesIO` shares the memory of bytes objects instead of copying it
+            return Image.open(io.BytesIO(self.data))
+        except OSError as e:
+            raise ImageSourceError(f'Cannot open image: {e}', self.source) from e
+
+    def resized(self, size, downscale='balanced'):
+        """Decode the image and resample it to `size`, see `resize_image`."""
+        try:
+            if self.data is None:
+                # the caller's image may be shared by several sources and loaded lazily
+                with _copy_lock:
+                    img = self.source.copy()
+            else:
+                img = self._open()
+            with img:
+                return resize_image(img, size, downscale)
+        except (OSError, ValueError) as e:
+            raise ImageSourceError(f'Cannot decode image: {e}', self.source) from e
+
+
+def open_source(source):
+    """
+    Return `source` ready to be laid out and rendered: paths are kept as is, bytes-like
+    objects, file objects and PIL images become a `SourceImage`.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    if isinstance(source, SourceImage):
+        return source
+    return SourceImage(source)
+
+
+def read_image_size(img_path, cache=None):
+    """
+    Return the dimensions of the image at `img_path`, read from its header or from `cache`.
+    A `SourceImage` knows its size already. Raise `ImageSourceError` when it cannot be read.
+    """
+    if isinstance(img_path, SourceImage):
+        return img_path.size
+    try:
+        if cache is not None:
+            size = cache.get_size(img_path)
+            if size is not None:
+                count('cache.size_hits')
+                return size
+            count('cache.size_misses')
+        # `Image.open` is lazy: only the header is parsed until pixels are accessed
+        with Image.open(img_path) as img:
+            size = img.size
+    except OSError as e:
+        raise ImageSourceError(f'Cannot read {img_path}: {e}', img_path) from e
+    if cache is not None:
+        cache.put_size(img_path, size)
+    return size
+
+
+def load_resized(img_path, size, downscale='balanced', cache=None):
+    """
+    Decode the image at `img_path` and resample it to `size`, or get it from `cache`.
+    A `SourceImage` is decoded from memory, without `cache`.
+    Raise `ImageSourceError` when the image cannot be read or decoded.
+    """
+    if isinstance(img_path, SourceImage):
+        return img_path.resized(size, downscale)
+    try:
+        if cache is not None:
+            img = cache.get_image(img_path, size, downscale)
+            if img is not None:
+                count('cache.hits')
+                return img
+            count('cache.misses')
+        with Image.open(img_path) as img:
+            img = resize_image(img, size, downscale)
+    except OSError as e:
+        raise ImageSourceError(f'Cannot read {img_path}: {e}', img_path) from e
+    count('images.decoded')
+    count('bytes.read', os.path.getsize(img_path))
+    if cache is not None:
+        cache.put_image(img_path, size, downscale, img)
+    return img
+
+
+def load_thumbnail(img_path, box, downscale='balanced', cache=None):
+    """
+    Decode the image at `img_path` to fit into `box`, keeping its aspect ratio.
+    Return the thumbnail and the original size of the image.
+    """
+    original_size = read_image_size(img_path, cache)
+    size = fit_size(original_size, box)
+    return load_resized(img_path, size, downscale, cache), original_size
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Layout engines - split images into justified rows from their sizes alone
+"""
+
+import math
+
+from .profiling import count, span
+
+MARGIN_SIZE = 2
+
+
+def fit_size(size, box):
+    """
+    Return the size `Image.thumbnail(box)` would give to an image of `size`.
+    """
+    w, h = size
+    box_w, box_h = box
+    if w <= box_w and h <= box_h:
+        return size
+    aspect = float(w) / h
+    if float(box_w) / box_h >= aspect:
+        return max(int(round(box_h * aspect)), 1), box_h
+    return box_w, max(int(round(box_w / aspect)), 1)
+
+
+def legacy_layout(sizes, width, row_height, margin_size=MARGIN_SIZE):
+    """
+    Original arrangement: fill lines with thumbnails of height `row_height`, and lower
+    `row_height` by 10 px until no line holds one image or fewer.
+    Return the list of `(line_height, indexes)` lines.
+    """
+    # run until a suitable arrangement of images is found
+    while True:
+        count('layout.iterations')
+        coefs_lines = []
+        images_line = []
+        x = 0
+        for index, size in enumerate(sizes):
+            # when `x` will go beyond the `width`, start the next line
+            if x > width:
+                coefs_lines.append((float(x) / width, images_line))
+                images_line = []
+                x = 0
+            x += fit_size(size, (width, row_height))[0] + margin_size
+            images_line.append(index)
+        # finally add the last line with images
+        coefs_lines.append((float(x) / width, images_line))
+
+        # compact the lines, by reducing the `row_height`, if any with one or less images
+        if len(coefs_lines) <= 1:
+            break
+        if any(map(lambda c: len(c[1]) <= 1, coefs_lines)) and row_height > 10:
+            # reduce `row_height`
+            row_height -= 10
+        else:
+            break
+    return [(row_height / coef, line) for coef, line in coefs_lines if line]
+
+
+def justified_layout(sizes, width, row_height, margin_size=MARGIN_SIZE):
+    """
+    Greedy justified rows in a single pass over the aspect ratios: a line is closed before or
+    after the image that brings it to `row_height`, whichever height is closer to `row_height`.
+    Full lines span exactly `width`, the last one keeps `row_height`.
+    Return the list of `(line_height, indexes)` lines.
+    """
+    count('layout.iterations')
+    lines = []
+    line = []
+    ratios_sum = 0.0
+    for index, (w, h) in enumerate(sizes):
+        ratio = float(w) / max(h, 1)
+        height = (width - margin_size * len(line)) / (ratios_sum + ratio)
+        if height > row_height:
+            # the line is still too high, keep adding images
+            line.append(index)
+            ratios_sum += ratio
+            continue
+        if line:
+            prev_height = (width - margin_size * (len(line) - 1)) / ratios_sum
+            # compare distances to `row_height` as ratios, so too high and too low weigh the same
+            if math.log(prev_height / row_height) < math.log(row_height / max(height, 1e-9)):
+                lines.append((prev_height, line))
+                line = []
+                ratios_sum = 0.0
+                height = width / ratio
+                if height > row_height:
+                    line.append(index)
+                    ratios_sum = ratio
+                    continue
+        line.append(index)
+        lines.append((max(height, 1.0), line))
+        line = []
+        ratios_sum = 0.0
+    # finally add the last, unfilled line with images
+    if line:
+        lines.append((float(row_height), line))
+    return lines
+
+
+LAYOUT_ENGINES = {
+    'justified': justified_layout,
+    'legacy': legacy_layout,
+}
+
+
+def place_lines(sizes, lines, margin_size=MARGIN_SIZE):
+    """
+    Turn `(line_height, indexes)` lines into pixel boxes.
+    Return the list of `(y, height, [(index, x, width), ...])` rows and the total height.
+    """
+    rows = []
+    y = 0
+    for line_height, line in lines:
+        height = max(int(round(line_height)), 1)
+        boxes = []
+        # accumulate in floats and round the edges, so rounding errors don't pile up on a line
+        right = 0.0
+        x = 0
+        for index in line:
+            w, h = sizes[index]
+            right += line_height * w / max(h, 1)
+            box_width = max(int(round(right)) - x, 1)
+            boxes.append((index, x, box_width))
+            x += box_width + margin_size
+            right += margin_size
+        rows.append((y, height, boxes))
+        y += height + margin_size
+    return rows, y
+
+
+def break_lines(sizes, width, row_height, engine='justified', margin_size=MARGIN_SIZE):
+    """
+    Break images of `sizes` into lines of a collage of width `width` with the `engine` layout.
+    Return the list of `(line_height, indexes)` lines.
+    """
+    try:
+        layout_engine = LAYOUT_ENGINES[engine]
+    except KeyError:
+        raise ValueError(f'Unknown layout engine: {engine}')
+    with span('layout', engine=engine, images=len(sizes)):
+        return layout_engine(sizes, width, row_height, margin_size)
+
+
+def compute_layout(sizes, width, row_height, engine='justified', margin_size=MARGIN_SIZE):
+    """
+    Arrange images of `sizes` into rows of a collage of width `width` with the `engine` layout.
+    Return the list of `(y, height, [(index, x, width), ...])` rows and the total height.
+    """
+    lines = break_lines(sizes, width, row_height, engine, margin_size)
+    return place_lines(sizes, lines, margin_size)
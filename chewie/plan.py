@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Layout plans - collage layouts that can be saved, loaded, rescaled and hit-tested
+"""
+
+import json
+import os
+import struct
+from bisect import bisect_right
+
+from .errors import PlanError
+from .layout import MARGIN_SIZE, break_lines, place_lines
+from .profiling import span
+
+PLAN_VERSION = 1
+# binary plans: magic, version, then little-endian fields
+PLAN_MAGIC = b'CHPL'
+# extensions of binary plans, others are JSON
+BINARY_PLAN_EXTENSIONS = ('.bin', '.plan')
+
+
+class LayoutPlan:
+    def __init__(self, images, sizes, width, row_height, engine, lines, margin_size=MARGIN_SIZE):
+        """
+        Layout of a collage: its images, the lines they are broken into with the height of each
+        line, and the pixel boxes of the images.
+
+        :param images: Image paths, or any ids, in collage order. Only plans of string ids
+            can be saved
+        :param sizes: Original (width, height) of each image
+        :param width: Width of the collage
+        :param row_height: Target row height the lines were broken for
+        :param engine: Name of the layout engine which broke the lines
+        :param lines: List of `(line_height, indexes)`, the scale of a line is its height
+        :param margin_size: Space between images
+        """
+        self.images = list(images)
+        self.sizes = [tuple(size) for size in sizes]
+        self.width = width
+        self.row_height = row_height
+        self.engine = engine
+        self.lines = [(float(line_height), list(indexes)) for line_height, indexes in lines]
+        self.margin_size = margin_size
+        self.rows, self.height = place_lines(self.sizes, self.lines, margin_size)
+        # lookups of `box_of` and `hit_test`
+        self._row_tops = [y for y, _, _ in self.rows]
+        self._box_lefts = [[x for _, x, _ in boxes] for _, _, boxes in self.rows]
+        self._boxes = [None] * len(self.images)
+        for y, height, boxes in self.rows:
+            for index, x, box_width in boxes:
+                self._boxes[index] = (x, y, box_width, height)
+
+    @classmethod
+    def build(cls, images, sizes, width, row_height, engine='justified', margin_size=MARGIN_SIZE):
+        """Lay out `images` of `sizes` with the `engine` layout, see `break_lines`."""
+        lines = break_lines(sizes, width, row_height, engine, margin_size)
+        return cls(images, sizes, width, row_height, engine, lines, margin_size)
+
+    def rescale(self, width):
+        """
+        Return the plan of the same collage at `width`: lines keep their images and only their
+        heights change, so each line fills the new width like it filled the old one.
+        """
+        with span('plan.rescale', images=len(self.images)):
+            lines = []
+            for line_height, indexes in self.lines:
+                margins = self.margin_size * (len(indexes) - 1)
+                factor = max(width - margins, 1) / max(self.width - margins, 1)
+                lines.append((line_height * factor, indexes))
+            return LayoutPlan(
+                self.images, self.sizes, width, self.row_height * width / self.width, self.engine,
+                lines, self.margin_size,
+            )
+
+    def box_of(self, index):
+        """Return the `(x, y, width, height)` box of the image at `index`."""
+        return self._boxes[index]
+
+    def hit_test(self, x, y):
+        """Return the index of the image at the (`x`, `y`) pixel of the collage, or None."""
+        row_index = bisect_right(self._row_tops, y) - 1
+        if row_index < 0:
+            return None
+        row_y, height, boxes = self.rows[row_index]
+        if y >= row_y + height:
+            # in the margin below the row
+            return None
+        box_index = bisect_right(self._box_lefts[row_index], x) - 1
+        if box_index < 0:
+            return None
+        index, box_x, box_width = boxes[box_index]
+        return index if x < box_x + box_width else None
+
+    def _image_ids(self):
+        """
+        Return the images of the plan, once checked they can be saved: only paths and other
+        string ids can, in-memory images are only valid in the process they were opened in.
+        """
+        for image in self.images:
+            if not isinstance(image, str):
+                raise PlanError(
+                    f'Plans of in-memory images cannot be saved, got a {type(image).__name__}'
+                )
+        return self.images
+
+    def to_dict(self):
+        """Return the plan as JSON serializable data. Raise `PlanError` for in-memory images."""
+        return {
+            'version': PLAN_VERSION,
+            'width': self.width,
+            'height': self.height,
+            'row_height': self.row_height,
+            'engine': self.engine,
+            'margin_size': self.margin_size,
+            'images': [
+                {'id': image, 'size': list(size)}
+                for image, size in zip(self._image_ids(), self.sizes)
+            ],
+            'lines': [
+                {'height': line_height, 'images': indexes} for line_height, indexes in self.lines
+            ],
+            'rows': [
+                {'y': y, 'height': height, 'boxes': [list(box) for box in boxes]}
+                for y, height, boxes in self.rows
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return the plan of `to_dict` data. Pixel boxes are placed again from the lines."""
+        if data.get('version') != PLAN_VERSION:
+            raise ValueError(f'Unsupported layout plan version: {data.get("version")}')
+        return cls(
+            [image['id'] for image in data['images']],
+            [image['size'] for image in data['images']],
+            data['width'], data['row_height'], data['engine'],
+            [(line['height'], line['images']) for line in data['lines']],
+            data['margin_size'],
+        )
+
+    def to_bytes(self):
+        """
+        Return the plan in a compact binary form, without the pixel boxes.
+        Raise `PlanError` for in-memory images.
+        """
+        chunks = [
+            PLAN_MAGIC,
+            struct.pack('<HIdII', PLAN_VERSION, self.width, self.row_height, self.margin_size,
+                        len(self.images)),
+        ]
+        engine = self.engine.encode()
+        chunks.append(struct.pack('<H', len(engine)) + engine)
+        for image, (width, height) in zip(self._image_ids(), self.sizes):
+            image = image.encode()
+            chunks.append(struct.pack('<III', len(image), width, height) + image)
+        chunks.append(struct.pack('<I', len(self.lines)))
+        for line_height, indexes in self.lines:
+            chunks.append(struct.pack(f'<dI{len(indexes)}I', line_height, len(indexes), *indexes))
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Return the plan of `to_bytes` data."""
+        if data[:4] != PLAN_MAGIC:
+            raise ValueError('Not a binary layout plan')
+        offset = 4
+
+        def read(fmt):
+            nonlocal offset
+            values = struct.unpack_from(fmt, data, offset)
+            offset += struct.calcsize(fmt)
+            return values
+
+        version, width, row_height, margin_size, count = read('<HIdII')
+        if version != PLAN_VERSION:
+            raise ValueError(f'Unsupported layout plan version: {version}')
+        engine_length, = read('<H')
+        engine = data[offset:offset + engine_length].decode()
+        offset += engine_length
+        images = []
+        sizes = []
+        for _ in range(count):
+            length, image_width, image_height = read('<III')
+            images.append(data[offset:offset + length].decode())
+            sizes.append((image_width, image_height))
+            offset += length
+        line_count, = read('<I')
+        lines = []
+        for _ in range(line_count):
+            line_height, length = read('<dI')
+            lines.append((line_height, list(read(f'<{length}I'))))
+        return cls(images, sizes, width, row_height, engine, lines, margin_size)
+
+    def save(self, filename):
+        """Write the plan to `filename`, in binary for .bin and .plan files, in JSON otherwise."""
+        # serialized first, so that nothing is written for plans which cannot be saved
+        if os.path.splitext(filename)[1].lower() in BINARY_PLAN_EXTENSIONS:
+            data = self.to_bytes()
+            with open(filename, 'wb') as f:
+                f.write(data)
+        else:
+            data = self.to_dict()
+            with open(filename, 'w') as f:
+                json.dump(data, f)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a plan written by `save`."""
+        if os.path.splitext(filename)[1].lower() in BINARY_PLAN_EXTENSIONS:
+            with open(filename, 'rb') as f:
+                return cls.from_bytes(f.read())
+        with open(filename) as f:
+            return cls.from_dict(json.load(f))
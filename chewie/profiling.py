@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling - record spans and counters of the collage pipeline as a Chrome trace
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    def __init__(self):
+        """
+        Record timed spans and counters, from any thread.
+        Save them with `save` and open the file in chrome://tracing or Perfetto.
+        """
+        self.events = []
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def _now(self):
+        """Return the time since the tracer was created, in microseconds."""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    @contextmanager
+    def span(self, name, **args):
+        """Record the time spent in the `with` block as the span `name`."""
+        start = self._now()
+        try:
+            yield
+        finally:
+            event = {
+                'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'ts': start,
+                'dur': self._now() - start, 'pid': self._pid, 'tid': threading.get_ident(),
+            }
+            if args:
+                event['args'] = args
+            with self._lock:
+                self.events.append(event)
+
+    def count(self, name, value=1):
+        """Add `value` to the counter `name`."""
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+            self.events.append({
+                'name': name, 'ph': 'C', 'ts': self._now(), 'pid': self._pid,
+                'args': {name: total},
+            })
+
+    def to_chrome_trace(self):
+        """Return the recorded events in the Chrome trace event format."""
+        with self._lock:
+            return {
+                'traceEvents': list(self.events),
+                'displayTimeUnit': 'ms',
+                'otherData': {'counters': dict(self.counters)},
+            }
+
+    def save(self, filename):
+        """Write the recorded events to `filename` as a Chrome trace."""
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+class NullTracer:
+    """Tracer used when profiling is off, it records nothing."""
+
+    @contextmanager
+    def span(self, name, **args):
+        yield
+
+    def count(self, name, value=1):
+        pass
+
+
+_tracer = NullTracer()
+
+
+def set_tracer(tracer):
+    """Make `tracer` record the spans and counters of the pipeline, None turns profiling off."""
+    global _tracer
+    _tracer = tracer if tracer is not None else NullTracer()
+
+
+def get_tracer():
+    """Return the active tracer."""
+    return _tracer
+
+
+def span(name, **args):
+    """Record the time spent in a `with` block with the active tracer."""
+    return _tracer.span(name, **args)
+
+
+def count(name, value=1):
+    """Add `value` to the counter `name` of the active tracer."""
+    _tracer.count(name, value)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Collage server - render collages for local clients over HTTP or a Unix socket, keeping layouts
+and resized images warm between requests
+
+    POST /collage  {"images": ["a.jpg", "b.png"], "width": 800, "height": 200, "format": "jpeg",
+                    "quality": 90}
+                   -> the encoded collage
+    GET  /status   -> JSON counters
+"""
+
+import json
+import os
+import socketserver
+import stat
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from .cache import source_key
+from .collage_maker import encode_collage, read_image_sizes, render_plan
+from .encode import normalize_format
+from .errors import CollageError
+from .plan import LayoutPlan
+
+# layouts kept warm, least recently used are dropped first
+MAX_LAYOUTS = 256
+# largest request body accepted, in bytes
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+
+class CollageRequestError(ValueError):
+    """Raised when a collage request is invalid."""
+
+
+class CollageService:
+    def __init__(self, render_options=None, workers=2, width=800, height=600, save_options=None):
+        """
+        Render collages on a pool of `workers` threads, reusing the layouts of image sets
+        already seen and the resized images of the `cache` render option.
+
+        :param render_options: Keyword arguments of `create_collage` (layout, jobs, downscale, cache)
+        :param workers: Number of collages rendered concurrently
+        :param width: Width of collages of requests without one
+        :param height: Target row height of requests without one
+        :param save_options: Quality options of `save_collage`
+        """
+        self.render_options = dict(render_options or {})
+        self.save_options = dict(save_options or {})
+        self.width = width
+        self.height = height
+        self.layouts = OrderedDict()
+        self.layout_hits = 0
+        self.layout_misses = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='collage-service')
+
+    def layout(self, images, width, height):
+        """
+        Return the `LayoutPlan` of `images`, computed once per image set and size.
+        Keys include the mtime and size of every image, so edited images get a new layout.
+        """
+        try:
+            key = (tuple(source_key(img_path) for img_path in images), width, height)
+        except OSError as e:
+            raise CollageRequestError(f'Cannot read {e.filename}: {e.strerror}')
+        with self._lock:
+            layout = self.layouts.get(key)
+            if layout is not None:
+                self.layouts.move_to_end(key)
+                self.layout_hits += 1
+                return layout
+            self.layout_misses += 1
+        cache = self.render_options.get('cache')
+        sizes = read_image_sizes(images, cache)
+        layout = LayoutPlan.build(
+            images, sizes, width, height, self.render_options.get('layout', 'justified')
+        )
+        with self._lock:
+            self.layouts[key] = layout
+            while len(self.layouts) > MAX_LAYOUTS:
+                self.layouts.popitem(last=False)
+        return layout
+
+    def render(self, images, width=None, height=None, image_format='jpeg', quality=None):
+        """
+        Render the collage of `images` on the worker pool and return it encoded in `image_format`,
+        with the service save options and `quality`, when given.
+        Raise `CollageRequestError` when the request cannot make a collage.
+        """
+        if not images:
+            raise CollageRequestError('No images for collage')
+        width = self.width if width is None else width
+        height = self.height if height is None else height
+        if width <= 0 or height <= 0:
+            raise CollageRequestError('Width and height must be positive')
+        image_format = _request_format(image_format)
+        save_options = dict(self.save_options)
+        if quality is not None:
+            if not 1 <= quality <= 100:
+                raise CollageRequestError('Quality must be between 1 and 100')
+            save_options['quality'] = quality
+        return self._executor.submit(
+            self._render, images, width, height, image_format, save_options
+        ).result()
+
+    def _render(self, images, width, height, image_format, save_options):
+        """Render and encode a collage, see `render`."""
+        with self._lock:
+            self.requests += 1
+        plan = self.layout(images, width, height)
+        if not plan.height:
+            raise CollageRequestError('Height of collage could not be 0')
+        options = {
+            name: value for name, value in self.render_options.items()
+            if name in ('jobs', 'downscale', 'cache', 'compositor')
+        }
+        collage_image = render_plan(plan, **options)
+        return encode_collage(collage_image, image_format, **save_options)
+
+    def status(self):
+        """Return counters describing the work done so far."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'layouts': len(self.layouts),
+                'layout_hits': self.layout_hits,
+                'layout_misses': self.layout_misses,
+            }
+
+    def close(self):
+        """Wait for the collages being rendered and stop the worker pool."""
+        self._executor.shutdown(wait=True)
+
+
+class CollageRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'chewie'
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.server.service.status())
+        else:
+            self._send_json(404, {'error': f'Unknown path: {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/collage':
+            self._send_json(404, {'error': f'Unknown path: {self.path}'})
+            return
+        try:
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                raise CollageRequestError('Invalid Content-Length')
+            if length < 0:
+                # reading a negative length would wait for the client to close the connection
+                raise CollageRequestError('Invalid Content-Length')
+            if length > MAX_REQUEST_BYTES:
+                raise CollageRequestError('Request too large')
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise CollageRequestError('The request must be a JSON object')
+            images = request.get('images')
+            if not isinstance(images, list) or not all(isinstance(path, str) for path in images):
+                raise CollageRequestError('"images" must be a list of paths')
+            image_format = _request_format(str(request.get('format', 'jpeg')))
+            data = self.server.service.render(
+                images, _optional_int(request, 'width'), _optional_int(request, 'height'),
+                image_format, _optional_int(request, 'quality'),
+            )
+        except (CollageRequestError, CollageError, OSError, json.JSONDecodeError) as e:
+            # invalid requests and images which cannot be read
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': f'{type(e).__name__}: {e}'})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', Image.MIME.get(image_format, 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, content):
+        """Send `content` as a JSON response with the `status` code."""
+        data = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # clients of Unix sockets have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+def _request_format(image_format):
+    """Return the Pillow name of the requested `image_format`, if Pillow can write it."""
+    try:
+        return normalize_format(image_format)
+    except ValueError as e:
+        raise CollageRequestError(str(e))
+
+
+def _optional_int(request, name):
+    """Return the integer field `name` of `request`, or None when it is missing."""
+    value = request.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise CollageRequestError(f'"{name}" must be an integer')
+    return value
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def remove_socket(socket_path):
+    """
+    Remove the Unix socket at `socket_path`, if there is one. Any other kind of file is left
+    as is and raises `FileExistsError`.
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f'{socket_path} exists and is not a socket')
+    os.unlink(socket_path)
+
+
+def create_server(service, host='127.0.0.1', port=8765, socket_path=None):
+    """
+    Return an HTTP server answering collage requests with `service`, listening on
+    `host`:`port`, or on the Unix socket `socket_path` when given. A socket left at
+    `socket_path` is replaced, any other file raises `FileExistsError`.
+    """
+    if socket_path is not None:
+        remove_socket(socket_path)
+        server = UnixHTTPServer(socket_path, CollageRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), CollageRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
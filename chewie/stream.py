@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming writers - encode a collage band by band, without holding the whole image in memory
+"""
+
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .canvas import canvas_array
+
+# PNG color types and TIFF photometric interpretations of the supported modes
+PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'RGBA': 6}
+MODE_CHANNELS = {'L': 1, 'RGB': 3, 'RGBA': 4}
+# modulus of the Adler-32 checksum ending zlib streams
+ADLER_BASE = 65521
+
+
+def adler32_combine(adler1, adler2, length2):
+    """
+    Return the Adler-32 of two concatenated buffers from their checksums `adler1` and `adler2`
+    and the length `length2` of the second one, like zlib's `adler32_combine`.
+    """
+    remainder = length2 % ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (remainder * sum1) % ADLER_BASE
+    sum1 = (sum1 + (adler2 & 0xffff) + ADLER_BASE - 1) % ADLER_BASE
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + ADLER_BASE - remainder) % ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def band_bytes(band):
+    """
+    Return the pixels of the `band` image, directly from its array when it was composited
+    into one, otherwise as a copy.
+    """
+    array = canvas_array(band)
+    if array is not None:
+        return memoryview(array).cast('B')
+    return band.tobytes()
+
+
+class PngStreamWriter:
+    def __init__(self, filename, width, height, mode='RGB', compress_level=6, jobs=1):
+        """
+        Write a PNG file one band of rows at a time.
+        With several `jobs`, bands are compressed in parallel as independent deflate blocks
+        joined into a single zlib stream, at the cost of larger files.
+
+        :param filename: Output filename
+        :param width: Image width
+        :param height: Image height, the bands must add up to it
+        :param mode: Image mode, 'L', 'RGB' or 'RGBA'
+        :param compress_level: zlib compression level
+        :param jobs: Number of threads compressing bands
+        """
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.compress_level = compress_level
+        self.rows_written = 0
+        self.file = open(filename, 'wb')
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack(
+            '>IIBBBBB', width, height, 8, PNG_COLOR_TYPES[mode], 0, 0, 0
+        ))
+        self.executor = None
+        if jobs > 1:
+            self.executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='png-encode')
+            self.max_pending = jobs * 2
+            self.pending = deque()
+            self.adler = zlib.adler32(b'')
+            # zlib header of the deflate blocks to come
+            self._write_chunk(b'IDAT', b'\x78\x9c')
+        else:
+            self.compressor = zlib.compressobj(compress_level)
+
+    def _write_chunk(self, chunk_type, data):
+        """Write a PNG chunk with its length and CRC."""
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+    def _scanlines(self, data):
+        """Return the pixel rows of `data`, each starting with its filter type, 0 for none."""
+        stride = self.width * MODE_CHANNELS[self.mode]
+        return b''.join(
+            b'\x00' + data[offset:offset + stride] for offset in range(0, len(data), stride)
+        )
+
+    def _compress_band(self, data):
+        """Return a band compressed as deflate blocks ending on a byte boundary, and its checksum."""
+        scanlines = self._scanlines(data)
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(scanlines) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return compressed, zlib.adler32(scanlines), len(scanlines)
+
+    def _write_compressed(self, future):
+        """Write a band compressed in parallel, they complete in order."""
+        compressed, adler, length = future.result()
+        self.adler = adler32_combine(self.adler, adler, length)
+        self._write_chunk(b'IDAT', compressed)
+
+    def write(self, band):
+        """Append the rows of the `band` image."""
+        self.write_rows(band_bytes(band), band.size[1])
+
+    def write_rows(self, data, rows):
+        """Append `rows` rows of raw pixels from `data`."""
+        if self.executor is not None:
+            # bound the number of bands in flight, so they don't pile up in memory
+            if len(self.pending) >= self.max_pending:
+                self._write_compressed(self.pending.popleft())
+            self.pending.append(self.executor.submit(self._compress_band, data))
+        else:
+            compressed = self.compressor.compress(self._scanlines(data))
+            if compressed:
+                self._write_chunk(b'IDAT', compressed)
+        self.rows_written += rows
+
+    def close(self):
+        """Finish the compressed stream and the file."""
+        if self.executor is not None:
+            try:
+                while self.pending:
+                    self._write_compressed(self.pending.popleft())
+            finally:
+                for future in self.pending:
+                    future.cancel()
+                self.executor.shutdown(wait=True)
+            # an empty final block, then the checksum of all scanlines
+            self._write_chunk(b'IDAT', b'\x03\x00' + struct.pack('>I', self.adler))
+        else:
+            self._write_chunk(b'IDAT', self.compressor.flush())
+        self._write_chunk(b'IEND', b'')
+        self.file.close()
+
+
+class TiffStreamWriter:
+    # TIFF field types
+    SHORT, LONG, LONG8 = 3, 4, 16
+    # files from this size are written as BigTIFF
+    BIG_TIFF_BYTES = 2 ** 32
+
+    def __init__(self, filename, width, height, mode='RGB'):
+        """
+        Write an uncompressed strip TIFF file one band of rows at a time.
+        Pixel data comes first and the directory last, so nothing has to be seeked back to.
+        Files of 4 GB or more are written as BigTIFF.
+
+        :param filename: Output filename
+        :param width: Image width
+        :param height: Image height, the bands must add up to it
+        :param mode: Image mode, 'L', 'RGB' or 'RGBA'
+        """
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows_written = 0
+        self.channels = MODE_CHANNELS[mode]
+        self.stride = width * self.channels
+        self.data_size = self.stride * height
+        self.big = self.data_size + 4096 >= self.BIG_TIFF_BYTES
+        self.header_size = 16 if self.big else 8
+        self.file = open(filename, 'wb')
+        # the directory offset is known upfront: right after the pixel data, word aligned
+        self.ifd_offset = self.header_size + self.data_size + (self.data_size & 1)
+        if self.big:
+            self.file.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, self.ifd_offset))
+        else:
+            self.file.write(b'II' + struct.pack('<HI', 42, self.ifd_offset))
+
+    def write(self, band):
+        """Append the rows of the `band` image."""
+        self.file.write(band_bytes(band))
+        self.rows_written += band.size[1]
+
+    def close(self):
+        """Write the image directory and finish the file."""
+        if self.data_size & 1:
+            self.file.write(b'\x00')
+        # strips of about 64 KB, all contiguous in the pixel data
+        rows_per_strip = max(1, min(self.height, 65536 // self.stride))
+        offsets = []
+        byte_counts = []
+        for row in range(0, self.height, rows_per_strip):
+            offsets.append(self.header_size + row * self.stride)
+            byte_counts.append(min(rows_per_strip, self.height - row) * self.stride)
+        offset_type = self.LONG8 if self.big else self.LONG
+        entries = [
+            (256, self.LONG, [self.width]),                      # ImageWidth
+            (257, self.LONG, [self.height]),                     # ImageLength
+            (258, self.SHORT, [8] * self.channels),              # BitsPerSample
+            (259, self.SHORT, [1]),                              # Compression: none
+            (262, self.SHORT, [1 if self.channels == 1 else 2]), # Photometric: gray or RGB
+            (273, offset_type, offsets),                         # StripOffsets
+            (277, self.SHORT, [self.channels]),                  # SamplesPerPixel
+            (278, self.LONG, [rows_per_strip]),                  # RowsPerStrip
+            (279, offset_type, byte_counts),                     # StripByteCounts
+            (284, self.SHORT, [1]),                              # PlanarConfiguration: chunky
+        ]
+        if self.mode == 'RGBA':
+            entries.append((338, self.SHORT, [2]))               # ExtraSamples: unassociated alpha
+        self._write_ifd(entries)
+        self.file.close()
+
+    def _write_ifd(self, entries):
+        """Write the image directory, with values too large for an entry stored after it."""
+        formats = {self.SHORT: 'H', self.LONG: 'I', self.LONG8: 'Q'}
+        if self.big:
+            count_format, entry_format, next_format, inline_size = '<Q', '<HHQ', '<Q', 8
+        else:
+            count_format, entry_format, next_format, inline_size = '<H', '<HHI', '<I', 4
+        ifd_size = (struct.calcsize(count_format) + len(entries) * (4 + 2 * inline_size)
+                    + struct.calcsize(next_format))
+        extra_offset = self.ifd_offset + ifd_size
+        ifd = struct.pack(count_format, len(entries))
+        extra = b''
+        for tag, field_type, values in entries:
+            data = struct.pack('<%d%s' % (len(values), formats[field_type]), *values)
+            ifd += struct.pack(entry_format, tag, field_type, len(values))
+            if len(data) <= inline_size:
+                ifd += data.ljust(inline_size, b'\x00')
+            else:
+                ifd += struct.pack('<Q' if self.big else '<I', extra_offset + len(extra))
+                extra += data
+                if len(extra) & 1:
+                    extra += b'\x00'
+        ifd += struct.pack(next_format, 0)
+        self.file.write(ifd + extra)
+
+
+class RawStreamWriter:
+    def __init__(self, filename, width, height, mode='RGB'):
+        """
+        Write raw interleaved pixels one band of rows at a time, ready to be memory mapped.
+        The image width, height and mode are written to a `<filename>.json` sidecar.
+
+        :param filename: Output filename
+        :param width: Image width
+        :param height: Image height, the bands must add up to it
+        :param mode: Image mode, 'L', 'RGB' or 'RGBA'
+        """
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows_written = 0
+        self.file = open(filename, 'wb')
+        with open(filename + '.json', 'w') as f:
+            json.dump({'width': width, 'height': height, 'mode': mode,
+                       'channels': MODE_CHANNELS[mode], 'dtype': 'uint8'}, f)
+
+    def write(self, band):
+        """Append the rows of the `band` image."""
+        self.file.write(band_bytes(band))
+        self.rows_written += band.size[1]
+
+    def close(self):
+        """Finish the file."""
+        self.file.close()
+
+
+STREAM_WRITERS = {
+    '.png': PngStreamWriter,
+    '.tif': TiffStreamWriter,
+    '.tiff': TiffStreamWriter,
+    '.raw': RawStreamWriter,
+}
+
+
+def open_stream_writer(filename, width, height, mode='RGB', compress_level=6, jobs=1):
+    """
+    Return the streaming writer matching the extension of `filename`.
+    `compress_level` and `jobs` only apply to PNG files, the others are not compressed.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    try:
+        writer_class = STREAM_WRITERS[ext]
+    except KeyError:
+        raise ValueError(
+            f'Streaming is not supported for {ext or "files without extension"}, '
+            f'use one of {", ".join(sorted(STREAM_WRITERS))}'
+        )
+    if writer_class is PngStreamWriter:
+        return writer_class(filename, width, height, mode, compress_level, jobs)
+    return writer_class(filename, width, height, mode)
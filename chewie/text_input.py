@@ -1,5 +1,7 @@
 import pygame
 
+from .fonts import get_font, render_text
+
 
 class TextInput:
     def __init__(self, x, y, width, height, default_text='', font_size=24):
@@ -19,8 +21,9 @@ class TextInput:
         self.color = self.color_inactive
         self.default_text = default_text
         self.text = default_text
-        self.font = pygame.font.Font(None, font_size)
-        self.txt_surface = self.font.render(self.text, True, self.color)
+        self.font_size = font_size
+        self.font = get_font(font_size)
+        self.txt_surface = render_text(self.text, self.font_size, self.color)
         self.active = False
         self.first_click = True
     
@@ -48,7 +51,7 @@ class TextInput:
             self.color = self.color_active if self.active else self.color_inactive
             
             # Re-render the text
-            self.txt_surface = self.font.render(self.text, True, self.color)
+            self.txt_surface = render_text(self.text, self.font_size, self.color)
         
         if event.type == pygame.KEYDOWN:
             if self.active:
@@ -63,7 +66,7 @@ class TextInput:
                     self.text += event.unicode
                 
                 # Re-render the text
-                self.txt_surface = self.font.render(self.text, True, self.color)
+                self.txt_surface = render_text(self.text, self.font_size, self.color)
         
         return None
     
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Thumbnail loader - decode sidebar thumbnails lazily in background threads
+"""
+
+import threading
+
+from .imaging import load_thumbnail
+
+
+class ThumbnailLoader:
+    def __init__(self, box, downscale='balanced', cache=None, workers=2, notify=None):
+        """
+        Load thumbnails in background threads, most wanted first.
+
+        :param box: (width, height) the thumbnails are fit into
+        :param downscale: Quality/speed trade-off when shrinking images
+        :param cache: Optional derivative cache
+        :param workers: Number of loading threads
+        :param notify: Optional function called from a loading thread when a thumbnail is ready
+        """
+        self.box = box
+        self.downscale = downscale
+        self.cache = cache
+        self.notify = notify
+        self._condition = threading.Condition()
+        self._wanted = []
+        self._in_flight = set()
+        self._results = []
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._run, name='thumbnail-loader', daemon=True)
+            for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def request(self, img_paths):
+        """
+        Replace the paths to load by `img_paths`, in priority order.
+        Paths requested before but no longer wanted are dropped unless already loading.
+        """
+        with self._condition:
+            self._wanted = [img_path for img_path in img_paths if img_path not in self._in_flight]
+            self._wanted.reverse()
+            self._condition.notify_all()
+
+    def poll(self):
+        """Return the `(img_path, thumbnail, original_size, error)` loaded since the last poll."""
+        with self._condition:
+            results, self._results = self._results, []
+            return results
+
+    def stop(self):
+        """Stop the loading threads once their current thumbnail is loaded."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+    def _run(self):
+        """Loading thread: load the most wanted thumbnail until stopped."""
+        while True:
+            with self._condition:
+                while self._running and not self._wanted:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                img_path = self._wanted.pop()
+                self._in_flight.add(img_path)
+
+            thumbnail = original_size = error = None
+            try:
+                thumbnail, original_size = load_thumbnail(
+                    img_path, self.box, self.downscale, self.cache
+                )
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                self._in_flight.discard(img_path)
+                self._results.append((img_path, thumbnail, original_size, error))
+                running = self._running
+            if running and self.notify is not None:
+                self.notify()
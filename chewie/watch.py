@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Folder watcher - follow the images of folders which change, by polling cheap directory listings
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .discovery import drop_duplicates, is_image, list_files
+from .profiling import count, span
+
+
+def update_order(images, added, removed):
+    """
+    Return `images` without the `removed` ones and with the `added` ones at the end, so the
+    collage of the images already there keeps its layout.
+    """
+    removed = set(removed)
+    present = set(images)
+    return [img_path for img_path in images if img_path not in removed] + [
+        img_path for img_path in added if img_path not in present
+    ]
+
+
+class FolderWatcher:
+    def __init__(self, roots, recursive=False, include=(), exclude=(), dedupe=False, interval=1.0,
+                 jobs=8):
+        """
+        Follow the images of `roots`. Each check lists the folders with `scandir` and only reads
+        the files whose size or mtime changed. A new or changed file is only taken into account
+        once it stayed the same for a whole `interval`, so files being copied are not read half
+        written. See `discover_images` for the other arguments.
+
+        :param interval: Seconds between checks
+        """
+        self.roots = roots
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.dedupe = dedupe
+        self.interval = interval
+        self.jobs = jobs
+        # `(size, mtime_ns)` of the files of the last listing, and of those already sniffed
+        self.listing = {}
+        self.known = {}
+        self.images = set()
+        self.reported = set()
+        self._condition = threading.Condition()
+        self._changes = []
+        self._thread = None
+        self._running = False
+
+    def scan(self):
+        """List the images of the folders as they are now, return their paths sorted."""
+        with span('watch.scan'):
+            self.listing = self._list_files()
+            self._sniff(list(self.listing))
+            self.reported = self._current_images()
+        return sorted(self.reported)
+
+    def check(self):
+        """
+        List the folders once more. Return the `(added, removed, modified)` image paths since
+        the previous check, or None when nothing changed.
+        """
+        with span('watch.check'):
+            listing = self._list_files()
+            settled = [
+                path for path, state in listing.items()
+                if self.known.get(path) != state and self.listing.get(path) == state
+            ]
+            gone = [path for path in self.known if path not in listing]
+            self.listing = listing
+            if not settled and not gone:
+                return None
+            for path in gone:
+                del self.known[path]
+                self.images.discard(path)
+            modified = [path for path in settled if path in self.images]
+            self._sniff(settled)
+
+            current = self._current_images()
+            added = sorted(current - self.reported)
+            removed = sorted(self.reported - current)
+            modified = [path for path in modified if path in current and path in self.reported]
+            self.reported = current
+        if not (added or removed or modified):
+            return None
+        count('watch.added', len(added))
+        count('watch.removed', len(removed))
+        return added, removed, modified
+
+    def _list_files(self):
+        """Return the `(size, mtime_ns)` of the files of the folders, by path."""
+        return list_files(self.roots, self.recursive, self.include, self.exclude, self.jobs)
+
+    def _sniff(self, paths):
+        """Tell which of `paths` are images, remembering the state they were read in."""
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as executor:
+            for path, image in zip(paths, executor.map(is_image, paths)):
+                self.known[path] = self.listing[path]
+                if image:
+                    self.images.add(path)
+                else:
+                    self.images.discard(path)
+
+    def _current_images(self):
+        """Return the set of images to show, without duplicates with `dedupe`."""
+        if not self.dedupe:
+            return set(self.images)
+        images = sorted((path, self.known[path][0]) for path in self.images)
+        return set(drop_duplicates(images, self.jobs))
+
+    def start(self, notify=None):
+        """
+        Check the folders every `interval` in a background thread, `poll` returns the changes.
+        `notify` is called from that thread when there are some.
+        """
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, args=(notify,), name='folder-watcher', daemon=True
+        )
+        self._thread.start()
+
+    def poll(self):
+        """Return the `(added, removed, modified)` changes found since the last poll."""
+        with self._condition:
+            changes, self._changes = self._changes, []
+            return changes
+
+    def stop(self):
+        """Stop the background checks."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+    def _run(self, notify):
+        """Watching thread: check the folders until stopped."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: not self._running, self.interval)
+                if not self._running:
+                    return
+            try:
+                change = self.check()
+            except OSError as e:
+                print(f"Error watching folders: {e}")
+                continue
+            if change is None:
+                continue
+            with self._condition:
+                self._changes.append(change)
+                running = self._running
+            if running and notify is not None:
+                notify()
@@ -1,16 +1,69 @@
 import pygame
 import sys
 import os
-from .collage_maker import create_collage
+import threading
+import time
+from collections import deque
+from PIL import Image
+from .canvas import canvas_array
+from .collage_maker import BACKGROUND_COLOR, StripRenderer, save_collage
+from .fonts import get_font, render_text
+from .imaging import has_alpha
+from .profiling import span
 from .text_input import TextInput
+from .thumbnails import ThumbnailLoader
+from .watch import update_order
+from .worker import CollageWorker
+from .zoom import ZoomPyramid
 
 def pilImageToSurface(pilImage):
+    """
+    Convert a PIL image to a surface sharing a single copy of its pixels.
+    The surface is built over the bytes of the image with `frombuffer` and keeps them alive,
+    instead of copying them once more like `fromstring`.
+    """
+    if pilImage.mode not in ('RGB', 'RGBA', 'RGBX'):
+        pilImage = pilImage.convert('RGBA' if has_alpha(pilImage) else 'RGB')
     mode = pilImage.mode
     size = pilImage.size
-    data = pilImage.tobytes()
-    return pygame.image.fromstring(data, size, mode)
+    # collages composited into an array are shown without any copy
+    data = canvas_array(pilImage)
+    if data is None:
+        data = pilImage.tobytes()
+    return pygame.image.frombuffer(data, size, mode)
 
 LIST_WIDTH = 250
+LIST_START_Y = 50
+# thumbnails are fit into a fixed box, whatever the number of images
+THUMBNAIL_WIDTH = LIST_WIDTH - 50
+THUMBNAIL_HEIGHT = 90
+THUMBNAIL_ROW_HEIGHT = THUMBNAIL_HEIGHT + 30
+# rows loaded above and below the visible ones, and rows kept before surfaces are dropped
+THUMBNAIL_PREFETCH = 10
+THUMBNAIL_KEEP = 50
+# posted by the collage worker when a regenerated collage is ready
+COLLAGE_READY = pygame.USEREVENT + 1
+# posted by the thumbnail loader when thumbnails are ready
+THUMBNAILS_READY = pygame.USEREVENT + 2
+# posted by the save thread when the collage is written
+COLLAGE_SAVED = pygame.USEREVENT + 3
+# posted by the folder watcher when images were added, removed or modified
+FOLDER_CHANGED = pygame.USEREVENT + 4
+# color of the images of a collage being rendered, until their draft or tile comes
+PLACEHOLDER_COLOR = (70, 70, 70)
+# how long the result of a save stays on screen, in seconds
+SAVE_MESSAGE_SECONDS = 2
+# keys which act on the viewer even while an input box has the focus
+NAVIGATION_KEYS = (
+    pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_ESCAPE, pygame.K_F3
+)
+
+def post_event(event_type):
+    """Post an event of `event_type` from any thread, unless pygame already quit."""
+    try:
+        pygame.event.post(pygame.event.Event(event_type))
+    except pygame.error:
+        pass
 
 class ThumbnailDragger:
     def __init__(self, thumbnails, list_x):
@@ -26,51 +79,55 @@ class ThumbnailDragger:
         self.drag_offset_y = 0
         self.original_y = None
     
-    def handle_event(self, event, start_y):
+    def index_at(self, pos, start_y, scroll_y=0):
+        """
+        Return the index of the thumbnail row under `pos`, or None.
+        Rows have a fixed height, so the index is computed from the scroll offset directly.
+        
+        :param pos: Mouse position
+        :param start_y: Starting Y coordinate of thumbnails
+        :param scroll_y: Scroll offset of the thumbnail list
+        """
+        x, y = pos
+        if not self.list_x < x < self.list_x + LIST_WIDTH or y < start_y:
+            return None
+        index = (y - start_y + scroll_y) // THUMBNAIL_ROW_HEIGHT
+        if 0 <= index < len(self.thumbnails):
+            return index
+        return None
+    
+    def handle_event(self, event, start_y, scroll_y=0):
         """
         Handle mouse events for dragging thumbnails
         
         :param event: Pygame event
         :param start_y: Starting Y coordinate of thumbnails
+        :param scroll_y: Scroll offset of the thumbnail list
         :return: Boolean indicating if list was reordered
         """
        
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            
-            # Check if click is in thumbnail list area
-             if event.pos[0] > self.list_x and event.pos[0] < self.list_x + LIST_WIDTH:
-                # Find which thumbnail was clicked
-                for i, img_data in enumerate(self.thumbnails):
-                    thumb_y = start_y + i * (img_data['surface'].get_height() + 30)
-                    thumb_rect = pygame.Rect(
-                        self.list_x + 25, 
-                        thumb_y, 
-                        img_data['surface'].get_width(), 
-                        img_data['surface'].get_height()
-                    )
-                    
-                    if thumb_rect.collidepoint(event.pos):
-                        self.dragging = i
-                        self.drag_offset_y = event.pos[1] - thumb_y
-                        self.original_y = thumb_y
-                        break
+            # Find which thumbnail was clicked
+            index = self.index_at(event.pos, start_y, scroll_y)
+            if index is not None:
+                thumb_y = start_y + index * THUMBNAIL_ROW_HEIGHT - scroll_y
+                self.dragging = index
+                self.drag_offset_y = event.pos[1] - thumb_y
+                self.original_y = thumb_y
         
         elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
             if self.dragging is not None:
                 # Calculate new position
-                mouse_y = event.pos[1]
-                new_index = max(0, min(len(self.thumbnails) - 1, 
-                    (mouse_y - start_y + self.drag_offset_y) // 
-                    (self.thumbnails[0]['surface'].get_height() + 30)
+                new_index = max(0, min(len(self.thumbnails) - 1,
+                    (event.pos[1] - start_y + scroll_y) // THUMBNAIL_ROW_HEIGHT
                 ))
+                dragged, self.dragging = self.dragging, None
                 
                 # Reorder thumbnails
-                if new_index != self.dragging:
-                    moved_item = self.thumbnails.pop(self.dragging)
+                if new_index != dragged:
+                    moved_item = self.thumbnails.pop(dragged)
                     self.thumbnails.insert(new_index, moved_item)
                     return True
-                
-                self.dragging = None
         
         return False
     
@@ -83,11 +140,33 @@ class ThumbnailDragger:
         return self.thumbnails
 
 class CollageViewer:
-    def __init__(self, images, output, width, height):
-        """Initialize the Collage Viewer with advanced features."""
+    def __init__(self, images, output, width, height, render_options=None, save_options=None,
+                 plan=None, save_plan=None, watcher=None):
+        """
+        Initialize the Collage Viewer with advanced features.
+        The window opens at once: the collage is rendered in the background, shown first as
+        placeholders, then as a draft, then tile by tile at full quality.
+        A layout `plan` of `images` is shown without laying them out again, and the plan of
+        the collage is written to `save_plan` along with it. With a `FolderWatcher`, images
+        added to the watched folders are appended to the collage, removed ones are dropped.
+        """
         self.images = images
         self.output = output
-        self._setup_initial_collage(width, height)
+        # extra keyword arguments for `create_collage` (layout engine, cache...)
+        self.render_options = render_options or {}
+        # quality options of `save_collage`, the collage is saved in a background thread
+        self.save_options = save_options or {}
+        self.save_thread = None
+        self.save_error = None
+        self.save_message = None
+        self.save_plan = save_plan
+        # rows are cached as strips, reordering only re-renders the rows that changed
+        self.strip_renderer = StripRenderer(**self.render_options)
+        self.strip_renderer.plan = plan
+        # image under the last click on the collage, found with the plan of the shown collage
+        self.selected_image = None
+        self.original_image = None
+        self.plan = plan
         self._setup_display()
         self._setup_scaling()
         self.width = width
@@ -95,16 +174,92 @@ class CollageViewer:
         self._setup_inputs()
         self._load_image_thumbnails()
         self._setup_thumbnail_dragger()
+        self._update_thumbnail_window()
+        self._setup_worker()
+        self.collage_worker.submit(self.images, int(width), int(height), progressive=True)
+        # the shown collage is drawn into while the first render progresses, saves wait for it
+        self.partial_collage = True
+        self.save_pending = False
+        # error of the latest finished render, None once one succeeded
+        self.collage_error = None
+        self.watcher = watcher
+        if watcher is not None:
+            watcher.start(notify=lambda: post_event(FOLDER_CHANGED))
     
-    def _setup_initial_collage(self, width, height):
-        """Create the initial collage image."""
-        try:
-            self.original_image = pilImageToSurface(
-                create_collage(self.images, width, height)
-            )
-        except Exception as e:
-            print(f"Error creating collage: {e}")
-            self.original_image = None
+    def _to_surface(self, collage_image):
+        """Return the surface of a collage just rendered, and its layout plan."""
+        return pilImageToSurface(collage_image), self.strip_renderer.plan
+
+    def _setup_worker(self):
+        """Start the background worker regenerating the collage."""
+        self.collage_worker = CollageWorker(
+            self.strip_renderer, convert=self._to_surface,
+            notify=lambda: post_event(COLLAGE_READY)
+        )
+
+    def _request_collage(self):
+        """Regenerate the collage in the background, the current one stays shown meanwhile."""
+        self.collage_worker.submit(self.images, int(self.width), int(self.height))
+        self._mark_dirty()
+
+    def _poll_progress(self):
+        """Show the placeholders, the draft and the tiles of a progressive render as they come."""
+        progress = self.collage_worker.poll_progress()
+        if not progress:
+            return
+        with span('viewer.progress', updates=len(progress)):
+            for stage, value in progress:
+                if stage == 'plan':
+                    self.plan = value
+                    self.original_image = self._placeholder_surface(value)
+                elif stage == 'draft':
+                    draft = pygame.transform.smoothscale(
+                        pilImageToSurface(value), self.original_image.get_size()
+                    )
+                    # only inside the boxes, margins stay as in the final collage
+                    for index in range(len(self.plan.images)):
+                        box = self.plan.box_of(index)
+                        self.original_image.blit(draft, box[:2], box)
+                elif stage == 'tile':
+                    img, position = value
+                    self.original_image.blit(pilImageToSurface(img), position)
+        # the surface changed in place, its zoom levels are stale
+        self.zoom_pyramid = None
+        self._mark_dirty()
+
+    def _placeholder_surface(self, plan):
+        """Return a surface of the size of the collage of `plan`, with a box per image."""
+        surface = pygame.Surface((plan.width, max(int(plan.height), 1)))
+        surface.fill(BACKGROUND_COLOR)
+        for index in range(len(plan.images)):
+            surface.fill(PLACEHOLDER_COLOR, plan.box_of(index))
+        return surface
+
+    def _poll_collage(self):
+        """Swap in the collage regenerated by the background worker, if any."""
+        self._poll_progress()
+        finished = self.collage_worker.poll()
+        if finished is None:
+            return
+        _, result, error = finished
+        self.collage_error = error
+        if error is not None:
+            print(f"Error recreating collage: {error}")
+            self._show_save_message(f"Render Failed: {error}", (255, 0, 0), SAVE_MESSAGE_SECONDS)
+            if self.partial_collage:
+                # the first render will never complete, there is nothing to save
+                self.original_image = None
+                self.zoom_pyramid = None
+                self.partial_collage = False
+                self.save_pending = False
+        elif result:
+            self.original_image, self.plan = result
+            self.selected_image = None
+            self.partial_collage = False
+        if self.save_pending:
+            self.save_pending = False
+            self._save_collage()
+        self._mark_dirty()
     
     def _setup_display(self):
         """Configure display settings."""
@@ -122,7 +277,14 @@ class CollageViewer:
         self.offset_y = 0
         self.BACKGROUND_COLOR = (0, 0, 0)  # Black background
         self.GRID_COLOR = (50, 50, 50)  # Dark gray grid to complement black background
-        self.font = pygame.font.Font(None, 24)
+        self.font = get_font(24)
+        self.zoom_pyramid = None
+        # the window is only redrawn when something changed: all of it, or `dirty_rects`
+        self.dirty = True
+        self.dirty_rects = None
+        # live frame time overlay, toggled with F3
+        self.show_frame_times = False
+        self.frame_times = deque(maxlen=120)
     
     def _setup_inputs(self):
         """Create text input boxes for width and height."""
@@ -152,72 +314,229 @@ class CollageViewer:
         self.thumbnail_dragger = ThumbnailDragger(self.image_thumbnails, list_x)
     
     def _load_image_thumbnails(self):
-        """Load and scale thumbnails for the image list."""
-        from PIL import Image
-        
-        self.image_thumbnails = []
-        
-        # Calculate maximum thumbnail dimensions
-        available_height = self.screen_height - 100  # Reserve space for title and margins
-        num_images = len(self.images)
+        """
+        Create the entries of the image list. Thumbnails themselves are loaded lazily in the
+        background, only for the visible rows and a prefetch window around them.
+        """
+        self.image_thumbnails = [
+            {
+                'surface': None,
+                'path': os.path.basename(img_path),
+                'original_size': None,
+                'original_path': img_path,
+                'error': False
+            }
+            for img_path in self.images
+        ]
+        self.thumbnails_by_path = {
+            img_data['original_path']: img_data for img_data in self.image_thumbnails
+        }
+        self.list_scroll = 0
+        # entries which have a surface, by path
+        self.loaded_thumbnails = {}
+        self.thumbnail_loader = ThumbnailLoader(
+            (THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT),
+            self.render_options.get('downscale', 'balanced'),
+            self.render_options.get('cache'),
+            notify=lambda: post_event(THUMBNAILS_READY)
+        )
+    
+    def _poll_folder(self):
+        """Apply the changes of the watched folders, only the rows after the first change are redrawn."""
+        changes = self.watcher.poll() if self.watcher is not None else []
+        if not changes:
+            return
+        forgotten = []
+        for added, removed, modified in changes:
+            self.images = update_order(self.images, added, removed)
+            forgotten.extend(removed)
+            forgotten.extend(modified)
+        # the strips of changed images are dropped, the others are reused
+        self.strip_renderer.forget(forgotten)
+        self._refresh_thumbnails(forgotten)
+        if self.images:
+            self._request_collage()
+        else:
+            self.original_image = self.plan = self.selected_image = None
+            self._mark_dirty()
 
-        max_thumbnail_height = max(1, available_height // (num_images*6))
-        max_thumbnail_width = LIST_WIDTH - 50  # Leave some margin
-        
+    def _refresh_thumbnails(self, forgotten):
+        """Rebuild the image list entries after the images changed, keeping the loaded ones."""
+        forgotten = set(forgotten)
+        entries = []
         for img_path in self.images:
-            try:
-                # Open image with Pillow
-                pil_img = Image.open(img_path)
-                
-                # Resize to fit within max dimensions while maintaining aspect ratio
-                pil_img.thumbnail((max_thumbnail_width, max_thumbnail_height), Image.LANCZOS)
-                
-                # Convert to Pygame surface
-                pygame_surface = pilImageToSurface(pil_img)
-                
-                self.image_thumbnails.append({
-                    'surface': pygame_surface,
+            img_data = self.thumbnails_by_path.get(img_path)
+            if img_data is None or img_path in forgotten:
+                img_data = {
+                    'surface': None,
                     'path': os.path.basename(img_path),
-                    'original_size': pil_img.size,
-                    'original_path': img_path
-                })
-            except Exception as e:
-                print(f"Error loading thumbnail for {img_path}: {e}")
+                    'original_size': None,
+                    'original_path': img_path,
+                    'error': False
+                }
+            entries.append(img_data)
+        self.image_thumbnails = entries
+        self.thumbnails_by_path = {
+            img_data['original_path']: img_data for img_data in self.image_thumbnails
+        }
+        self.loaded_thumbnails = {
+            img_path: img_data for img_path, img_data in self.loaded_thumbnails.items()
+            if self.thumbnails_by_path.get(img_path) is img_data
+        }
+        self._setup_thumbnail_dragger()
+        self._scroll_thumbnails(0)
+
+    def _visible_thumbnail_rows(self):
+        """Return the range of thumbnail rows visible in the image list."""
+        first = self.list_scroll // THUMBNAIL_ROW_HEIGHT
+        last = (self.list_scroll + self.screen_height - LIST_START_Y) // THUMBNAIL_ROW_HEIGHT
+        return range(first, min(last + 1, len(self.image_thumbnails)))
+    
+    def _update_thumbnail_window(self):
+        """Request the thumbnails around the visible rows, drop the surfaces far from them."""
+        visible = self._visible_thumbnail_rows()
+        start = max(0, visible.start - THUMBNAIL_PREFETCH)
+        stop = min(len(self.image_thumbnails), visible.stop + THUMBNAIL_PREFETCH)
+        # visible rows first, then the prefetch window below and above them
+        order = list(visible) + list(range(visible.stop, stop)) + list(range(start, visible.start))
+        self.thumbnail_loader.request([
+            self.image_thumbnails[i]['original_path'] for i in order
+            # thumbnails which failed to load are not requested again
+            if self.image_thumbnails[i]['surface'] is None
+            and not self.image_thumbnails[i]['error']
+        ])
+        
+        keep = set(
+            self.image_thumbnails[i]['original_path'] for i in range(
+                max(0, visible.start - THUMBNAIL_KEEP),
+                min(len(self.image_thumbnails), visible.stop + THUMBNAIL_KEEP)
+            )
+        )
+        for img_path in list(self.loaded_thumbnails):
+            if img_path not in keep:
+                self.loaded_thumbnails.pop(img_path)['surface'] = None
+    
+    def _poll_thumbnails(self):
+        """Turn the thumbnails loaded in the background into surfaces."""
+        results = self.thumbnail_loader.poll()
+        if not results:
+            return
+        for img_path, thumbnail, original_size, error in results:
+            img_data = self.thumbnails_by_path.get(img_path)
+            if img_data is None:
+                continue
+            if error is not None:
+                print(f"Error loading thumbnail for {img_path}: {error}")
+                img_data['error'] = True
+                continue
+            surface = pilImageToSurface(thumbnail)
+            img_data['surface'] = surface.convert_alpha() if has_alpha(thumbnail) else surface.convert()
+            img_data['original_size'] = original_size
+            self.loaded_thumbnails[img_path] = img_data
+        self._update_thumbnail_window()
+        self._mark_dirty(pygame.Rect(self.screen_width - LIST_WIDTH, 0, LIST_WIDTH, self.screen_height))
+    
+    def _scroll_thumbnails(self, delta):
+        """Scroll the image list by `delta` pixels."""
+        max_scroll = max(
+            0, len(self.image_thumbnails) * THUMBNAIL_ROW_HEIGHT - (self.screen_height - LIST_START_Y)
+        )
+        self.list_scroll = max(0, min(max_scroll, self.list_scroll + delta))
+        self._update_thumbnail_window()
     
     def zoom(self, factor):
         """Adjust image zoom with limits."""
         self.scale *= factor
         self.scale = max(0.1, min(self.scale, 10))
     
+    def _mark_dirty(self, rect=None):
+        """Schedule a redraw of `rect`, or of the whole window."""
+        if rect is None:
+            self.dirty_rects = None
+        elif not self.dirty:
+            self.dirty_rects = [rect]
+        elif self.dirty_rects is not None:
+            self.dirty_rects.append(rect)
+        self.dirty = True
+
     def render(self):
-        """Render the current state of the collage viewer."""
+        """Render the current state of the collage viewer, if it changed."""
+        if not self.dirty:
+            return
+        start = time.perf_counter()
+        if self.dirty_rects is not None:
+            # blits outside of the changed area are clipped away
+            self.screen.set_clip(self.dirty_rects[0].unionall(self.dirty_rects[1:]))
         self._clear_screen()
-        scaled_image = self._get_scaled_image()
-        self._draw_image(scaled_image)
+        self._draw_image(self._get_scaled_image())
         self._render_text_and_inputs()
         self._render_image_list()
-        pygame.display.flip()
+        self._render_busy_overlay()
+        self._render_frame_times()
+        self._render_save_message()
+        self.screen.set_clip(None)
+        with span('viewer.present'):
+            if self.dirty_rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(self.dirty_rects)
+        self.dirty = False
+        self.dirty_rects = None
+        self.frame_times.append(time.perf_counter() - start)
+    
+    def _render_frame_times(self):
+        """Render the last, average and worst frame times, when the overlay is on."""
+        if not self.show_frame_times or not self.frame_times:
+            return
+        last = self.frame_times[-1] * 1000
+        average = sum(self.frame_times) / len(self.frame_times) * 1000
+        worst = max(self.frame_times) * 1000
+        text_surface = get_font(24).render(
+            f"Frame: {last:.1f} ms (avg {average:.1f} ms, max {worst:.1f} ms)", True, (0, 255, 0)
+        )
+        self.screen.blit(text_surface, (10, 80))
     
     def _clear_screen(self):
         """Clear the screen with background color."""
         self.screen.fill(self.BACKGROUND_COLOR)
     
     def _get_scaled_image(self):
-        """Calculate and return scaled image."""
-        scaled_width = int(self.original_image.get_width() * self.scale)
-        scaled_height = int(self.original_image.get_height() * self.scale)
-        return pygame.transform.scale(
-            self.original_image, 
-            (scaled_width, scaled_height)
+        """
+        Return the visible part of the scaled image and its position, or None.
+        Only the viewport is scaled, from the closest level of a zoom pyramid.
+        """
+        if self.original_image is None:
+            return None
+        if self.zoom_pyramid is None or self.zoom_pyramid.surface is not self.original_image:
+            self.zoom_pyramid = ZoomPyramid(self.original_image)
+        return self.zoom_pyramid.get_view(
+            self.scale, self.offset_x, self.offset_y, (self.screen_width, self.screen_height)
         )
     
-    def _draw_image(self, scaled_image):
-        """Position and draw the scaled image."""
-        scaled_width = scaled_image.get_width()
-        scaled_height = scaled_image.get_height()
-        pos_x = (self.screen_width - scaled_width) // 2 + self.offset_x
-        pos_y = (self.screen_height - scaled_height) // 2 + self.offset_y
-        self.screen.blit(scaled_image, (pos_x, pos_y))
+    def _render_busy_overlay(self):
+        """Tell the collage is being regenerated in the background."""
+        if not self.collage_worker.busy:
+            return
+        text_surface = render_text("Rendering...", 24, (255, 255, 0))
+        self.screen.blit(text_surface, (10, self.screen_height - 90))
+
+    def _render_save_message(self):
+        """Show the progress or the result of the last save."""
+        if self.save_message is None:
+            return
+        text, color, _ = self.save_message
+        text_surface = render_text(text, 36, color)
+        self.screen.blit(
+            text_surface,
+            text_surface.get_rect(center=(self.screen_width // 2, self.screen_height // 2)),
+        )
+
+    def _draw_image(self, scaled_view):
+        """Draw the visible part of the scaled image at its position."""
+        if scaled_view is None:
+            return
+        scaled_image, pos = scaled_view
+        self.screen.blit(scaled_image, pos)
     
     def _render_text_and_inputs(self):
         """Render text information and input boxes."""
@@ -226,19 +545,50 @@ class CollageViewer:
             (f"Height:", (10, 10)),
             (f"Width:", (140, 10)),
             (f"Nb images: {len(self.images)}", (10, self.screen_height - 60)),
-            ("Scroll to zoom, Arrow keys to move, Esc to quit", 
+            (self._selected_image_text(), (10, self.screen_height - 120)),
+            ("Scroll to zoom, Arrow keys to move, F3 for frame times, Esc to quit", 
              (10, self.screen_height - 30))
         ]
         
         for text, pos in texts:
-            text_surface = self.font.render(text, True, (255, 255, 255))
+            text_surface = render_text(text, 24, (255, 255, 255))
             self.screen.blit(text_surface, pos)
         
         self.height_input.draw(self.screen)
         self.width_input.draw(self.screen)
     
+    def _selected_image_text(self):
+        """Describe the image picked on the collage, if any."""
+        if self.selected_image is None:
+            return ""
+        x, y, width, height = self.plan.box_of(self.selected_image)
+        name = os.path.basename(self.plan.images[self.selected_image])
+        return f"Image {self.selected_image + 1}: {name} ({width}x{height} at {x},{y})"
+
+    def _select_image_at(self, pos):
+        """
+        Select the image under the `pos` screen position, hit-testing the plan of the collage,
+        and scroll the image list to it.
+        """
+        if self.original_image is None or self.plan is None:
+            return
+        scaled_width = int(self.original_image.get_width() * self.scale)
+        scaled_height = int(self.original_image.get_height() * self.scale)
+        pos_x = (self.screen_width - scaled_width) // 2 + self.offset_x
+        pos_y = (self.screen_height - scaled_height) // 2 + self.offset_y
+        index = self.plan.hit_test(
+            int((pos[0] - pos_x) / self.scale), int((pos[1] - pos_y) / self.scale)
+        )
+        self.selected_image = index
+        if index is not None:
+            visible_height = self.screen_height - LIST_START_Y
+            self._scroll_thumbnails(
+                index * THUMBNAIL_ROW_HEIGHT - (visible_height - THUMBNAIL_ROW_HEIGHT) // 2
+                - self.list_scroll
+            )
+
     def _render_image_list(self):
-        """Render the list of images on the right side of the window."""
+        """Render the visible rows of the list of images on the right side of the window."""
         # Define list area
         list_x = self.screen_width - LIST_WIDTH
         
@@ -249,32 +599,47 @@ class CollageViewer:
                          (list_x, 0), (list_x, self.screen_height), 2)
         
         # Render title
-        title_font = pygame.font.Font(None, 24)
-        title_text = title_font.render("Images", True, (0, 0, 0))
+        title_text = render_text("Images", 24, (0, 0, 0))
         self.screen.blit(title_text, (list_x + 10, 10))
         
-        # Render thumbnails and filenames
-        start_y = 50
+        # Rows scroll below the title
+        clip = self.screen.get_clip()
+        self.screen.set_clip(clip.clip(pygame.Rect(
+            list_x, LIST_START_Y, LIST_WIDTH, self.screen_height - LIST_START_Y
+        )))
         thumbnails = self.thumbnail_dragger.get_dragged_thumbnails()
         
-        for i, img_data in enumerate(thumbnails):
+        for i in self._visible_thumbnail_rows():
+            img_data = thumbnails[i]
             # Position for this thumbnail
-            thumb_y = start_y + i * (img_data['surface'].get_height() + 30)
+            thumb_y = LIST_START_Y + i * THUMBNAIL_ROW_HEIGHT - self.list_scroll
             
-            if thumb_y + img_data['surface'].get_height() > self.screen_height:
-                break
-            
-            # Draw thumbnail
-            self.screen.blit(img_data['surface'], (list_x + 25, thumb_y))
+            # Draw thumbnail, or a placeholder until it is loaded
+            if img_data['surface'] is not None:
+                self.screen.blit(img_data['surface'], (list_x + 25, thumb_y))
+            else:
+                pygame.draw.rect(self.screen, (200, 200, 200),
+                                 (list_x + 25, thumb_y, THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
             
             # Draw filename and original size
-            nb_images = len(self.images)
-            filename_font = pygame.font.Font(None, max(8, 16 - nb_images))
-            filename_text = filename_font.render(
-                f"{img_data['path']} ({img_data['original_size'][0]}x{img_data['original_size'][1]})", 
-                True, (0, 0, 0)
-            )
-            self.screen.blit(filename_text, (list_x + 25, thumb_y + img_data['surface'].get_height() + 5))
+            label = img_data['path']
+            if img_data['original_size'] is not None:
+                label += f" ({img_data['original_size'][0]}x{img_data['original_size'][1]})"
+            filename_text = render_text(label, 16, (0, 0, 0))
+            self.screen.blit(filename_text, (list_x + 25, thumb_y + THUMBNAIL_HEIGHT + 5))
+        
+        self._render_list_scrollbar(list_x)
+        self.screen.set_clip(clip)
+    
+    def _render_list_scrollbar(self, list_x):
+        """Render the scrollbar of the image list, when it doesn't fit on screen."""
+        list_height = self.screen_height - LIST_START_Y
+        content_height = len(self.image_thumbnails) * THUMBNAIL_ROW_HEIGHT
+        if content_height <= list_height:
+            return
+        bar_height = max(20, list_height * list_height // content_height)
+        bar_y = LIST_START_Y + (list_height - bar_height) * self.list_scroll // (content_height - list_height)
+        pygame.draw.rect(self.screen, (150, 150, 150), (list_x + LIST_WIDTH - 8, bar_y, 6, bar_height))
     
     def run(self):
         """Main event loop for the viewer."""
@@ -282,12 +647,30 @@ class CollageViewer:
         running = True
         
         while running:
-            for event in pygame.event.get():
-                running = self._handle_event(event)
+            events = pygame.event.get()
+            if not events and not self.dirty:
+                # idle: sleep until something happens, the worker posts COLLAGE_READY
+                events = [pygame.event.wait(250)]
+            for event in events:
+                running = self._handle_event(event) and running
             
+            self._poll_collage()
+            self._poll_thumbnails()
+            self._poll_save()
+            self._poll_folder()
+            if self.show_frame_times:
+                # keep the overlay live
+                self._mark_dirty()
             self.render()
             clock.tick(60)
         
+        self.collage_worker.stop()
+        self.thumbnail_loader.stop()
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.save_thread is not None:
+            # don't leave a truncated file behind
+            self.save_thread.join()
         pygame.quit()
         sys.exit()
     
@@ -296,6 +679,8 @@ class CollageViewer:
         if event.type == pygame.QUIT:
             return False
         
+        self._mark_event_dirty(event)
+        
         if event.type == pygame.VIDEORESIZE:
             self._resize_window(event)
         
@@ -304,24 +689,28 @@ class CollageViewer:
             # Save collage when 'S' key is pressed
             if event.key == pygame.K_s:
                 self._save_collage()
+            # Toggle the frame time overlay when 'F3' is pressed
+            elif event.key == pygame.K_F3:
+                self.show_frame_times = not self.show_frame_times
+                self.frame_times.clear()
         
         # Handle thumbnail drag and drop
-        start_y = 50
-        
-        if self.thumbnail_dragger.handle_event(event, start_y):
+        if self.thumbnail_dragger.handle_event(event, LIST_START_Y, self.list_scroll):
             # If thumbnails were reordered, update images list and regenerate collage
             self.images = [
                 img_data['original_path'] for img_data in self.image_thumbnails
             ]
             
             # Regenerate collage with new image order
-            try:
-                self.original_image = pilImageToSurface(
-                    create_collage(self.images, int(self.width), int(self.height))
-                )
-            except Exception as e:
-                print(f"Error recreating collage: {e}")
+            self._request_collage()
+            self._update_thumbnail_window()
         
+        if (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1
+                and event.pos[0] < self.screen_width - LIST_WIDTH
+                and not self.height_input.rect.collidepoint(event.pos)
+                and not self.width_input.rect.collidepoint(event.pos)):
+            self._select_image_at(event.pos)
+
         height_result = self.height_input.handle_event(event)
         width_result = self.width_input.handle_event(event)
         
@@ -330,6 +719,23 @@ class CollageViewer:
         
         return True
     
+    def _mark_event_dirty(self, event):
+        """Schedule the redraw `event` may need."""
+        if event.type in (pygame.NOEVENT, COLLAGE_READY, THUMBNAILS_READY, FOLDER_CHANGED):
+            return
+        if event.type == pygame.MOUSEMOTION and self.thumbnail_dragger.dragging is None:
+            return
+        if event.type == pygame.KEYDOWN and event.key not in NAVIGATION_KEYS:
+            for text_input in (self.height_input, self.width_input):
+                if text_input.active:
+                    # typing only changes the input box, which may grow up to the list
+                    self._mark_dirty(pygame.Rect(
+                        text_input.rect.x, text_input.rect.y,
+                        self.screen_width - LIST_WIDTH - text_input.rect.x, text_input.rect.h
+                    ))
+                    return
+        self._mark_dirty()
+
     def _resize_window(self, event):
         """Resize the window and reposition inputs."""
         self.screen_width, self.screen_height = event.size
@@ -338,49 +744,70 @@ class CollageViewer:
             pygame.RESIZABLE
         )
         self._setup_thumbnail_dragger()
+        self._scroll_thumbnails(0)
 
     def _save_collage(self):
         """
-        Save the current collage to the output path.
-        Provides user feedback about the save operation.
+        Save the current collage to the output path in a background thread, with Pillow and
+        the save options. The event loop keeps running, the result is shown once it is written.
         """
+        if self.original_image is None:
+            return
+        if self.partial_collage:
+            # the surface is still being drawn into, save it once it is complete
+            self.save_pending = True
+            self._show_save_message("Saving once rendered...", (255, 255, 0), None)
+            return
+        if self.save_thread is not None:
+            self._show_save_message("Save in progress...", (255, 255, 0), None)
+            return
+        self.save_error = None
+        self.save_thread = threading.Thread(
+            target=self._save_in_background, args=(self.original_image, self.plan, self.output),
+            name='collage-save', daemon=True,
+        )
+        self.save_thread.start()
+        self._show_save_message("Saving...", (255, 255, 0), None)
+
+    def _save_in_background(self, surface, plan, output):
+        """Encode `surface` to `output`, and its `plan` when asked to, then notify the event loop."""
         try:
-            # Convert Pygame surface back to PIL Image
-            from PIL import Image
-            import pygame.image
-            
-            # Ensure output directory exists
-            import os
-            #os.makedirs(os.path.dirname(self.output), exist_ok=True)
-            
-            # Save the original image
-            pygame.image.save(self.original_image, self.output)
-            
-            # Optional: Display save confirmation
-            print(f"Collage saved successfully to {self.output}")
-            
-            # Optional: Create a temporary surface for save confirmation
-            font = pygame.font.Font(None, 36)
-            save_text = font.render("Collage Saved!", True, (0, 255, 0))
-            text_rect = save_text.get_rect(center=(self.screen_width//2, self.screen_height//2))
-            
-            # Briefly show save confirmation
-            self.screen.blit(save_text, text_rect)
-            pygame.display.flip()
-            pygame.time.wait(1000)  # Show message for 1 second
-        
+            with span('viewer.save'):
+                if self.save_plan and plan is not None:
+                    plan.save(self.save_plan)
+                mode = 'RGBA' if surface.get_flags() & pygame.SRCALPHA else 'RGB'
+                image = Image.frombytes(mode, surface.get_size(), pygame.image.tobytes(surface, mode))
+                save_collage(
+                    image, output, jobs=self.render_options.get('jobs', 1), **self.save_options
+                )
         except Exception as e:
-            print(f"Error saving collage: {e}")
-            
-            # Optional: Display error message
-            font = pygame.font.Font(None, 36)
-            error_text = font.render(f"Save Failed: {str(e)}", True, (255, 0, 0))
-            text_rect = error_text.get_rect(center=(self.screen_width//2, self.screen_height//2))
-            
-            self.screen.blit(error_text, text_rect)
-            pygame.display.flip()
-            pygame.time.wait(2000)  # Show error for 2 seconds
-    
+            self.save_error = e
+        post_event(COLLAGE_SAVED)
+
+    def _poll_save(self):
+        """Report a finished save, and clear its message once it was shown long enough."""
+        if self.save_thread is not None and not self.save_thread.is_alive():
+            self.save_thread = None
+            if self.save_error is None:
+                print(f"Collage saved successfully to {self.output}")
+                self._show_save_message("Collage Saved!", (0, 255, 0), SAVE_MESSAGE_SECONDS)
+            else:
+                print(f"Error saving collage: {self.save_error}")
+                self._show_save_message(
+                    f"Save Failed: {self.save_error}", (255, 0, 0), SAVE_MESSAGE_SECONDS
+                )
+        if self.save_message is not None:
+            expires_at = self.save_message[2]
+            if expires_at is not None and time.monotonic() > expires_at:
+                self.save_message = None
+                self._mark_dirty()
+
+    def _show_save_message(self, text, color, seconds):
+        """Show `text` over the collage for `seconds`, or until replaced when None."""
+        expires_at = None if seconds is None else time.monotonic() + seconds
+        self.save_message = (text, color, expires_at)
+        self._mark_dirty()
+
     def _process_input_results(self, height_result, width_result):
         """Process height and width input results."""
         if height_result is not None:
@@ -402,21 +829,21 @@ class CollageViewer:
     def _update_collage_height(self, new_height):
         """Update collage height and regenerate image."""
         self.height = new_height
-        self.original_image = pilImageToSurface(
-            create_collage(self.images, int(self.width), int(self.height))
-        )
+        self._request_collage()
     
     def _update_collage_width(self, new_width):
         """Update collage width and regenerate image."""
         self.width = new_width
-        self.original_image = pilImageToSurface(
-            create_collage(self.images, int(self.width), int(self.height))
-        )
+        self._request_collage()
     
     def _handle_zoom_and_navigation(self, event):
         """Handle zoom and navigation events."""
         if event.type == pygame.MOUSEWHEEL:
-            self.zoom(1.1 ** event.y)
+            # the wheel scrolls the image list under the mouse, and zooms elsewhere
+            if pygame.mouse.get_pos()[0] > self.screen_width - LIST_WIDTH:
+                self._scroll_thumbnails(-event.y * THUMBNAIL_ROW_HEIGHT // 2)
+            else:
+                self.zoom(1.1 ** event.y)
         
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
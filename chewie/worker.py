@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Collage worker - regenerate collages in a background thread, newest request first
+"""
+
+import threading
+
+from .profiling import span
+
+
+class CollageCancelled(Exception):
+    """Raised inside a render when a newer request made it stale."""
+
+
+class CollageWorker:
+    def __init__(self, renderer, convert=None, notify=None):
+        """
+        Regenerate collages with `renderer` in a background thread.
+        Only the latest request matters: submitting cancels the one in flight.
+
+        :param renderer: Object with a `render(images, width, height, should_cancel, progress)`
+            method, `progress` is only passed for progressive requests
+        :param convert: Optional function applied to each result in the worker thread
+        :param notify: Optional function called from the worker thread when a result or
+            progress is ready
+        """
+        self.renderer = renderer
+        self.convert = convert
+        self.notify = notify
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._request = None
+        self._result = None
+        self._progress = []
+        self._running = True
+        self.busy = False
+        self._thread = threading.Thread(target=self._run, name='collage-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, images, width, height, progressive=False):
+        """
+        Queue a collage of `images`, cancelling any older request. Return its generation.
+        The renderer of a `progressive` request reports its progress, see `poll_progress`.
+        """
+        with self._condition:
+            self._generation += 1
+            self._request = (self._generation, list(images), width, height, progressive)
+            self._progress = []
+            self.busy = True
+            self._condition.notify()
+            return self._generation
+
+    def poll(self):
+        """
+        Return `(generation, result, error)` of the latest finished request, or None.
+        Results of requests made stale while rendering are never returned.
+        """
+        with self._condition:
+            result, self._result = self._result, None
+            return result
+
+    def poll_progress(self):
+        """
+        Return the `(stage, value)` progress reported by the renderer for the latest
+        request since the last poll, see `StripRenderer.render`.
+        """
+        with self._condition:
+            progress, self._progress = self._progress, []
+            return progress
+
+    def _report(self, generation, stage, value):
+        """Keep progress of the request `generation`, notify when nothing was waiting yet."""
+        with self._condition:
+            if self._is_stale(generation):
+                return
+            waiting = bool(self._progress)
+            self._progress.append((stage, value))
+        if not waiting and self.notify is not None:
+            self.notify()
+
+    def stop(self):
+        """Stop the worker thread once its current render is over or cancelled."""
+        with self._condition:
+            self._running = False
+            self._generation += 1
+            self._condition.notify()
+
+    def _is_stale(self, generation):
+        """Tell if a newer request or a stop superseded the request `generation`."""
+        return generation != self._generation
+
+    def _run(self):
+        """Worker thread: render the latest request until stopped."""
+        while True:
+            with self._condition:
+                while self._running and self._request is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                generation, images, width, height, progressive = self._request
+                self._request = None
+
+            result = error = None
+            options = {}
+            if progressive:
+                options['progress'] = (
+                    lambda stage, value: self._report(generation, stage, value)
+                )
+            try:
+                with span('worker.render', generation=generation):
+                    result = self.renderer.render(
+                        images, width, height, should_cancel=lambda: self._is_stale(generation),
+                        **options
+                    )
+                    if self.convert is not None and result:
+                        result = self.convert(result)
+            except CollageCancelled:
+                continue
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                if self._is_stale(generation):
+                    continue
+                self._result = (generation, result, error)
+                self.busy = False
+            if self.notify is not None:
+                self.notify()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Zoom pyramid - scale only the visible part of a collage, from the closest precomputed level
+"""
+
+import math
+import pygame
+
+
+class ZoomPyramid:
+    def __init__(self, surface):
+        """
+        Power of two levels of `surface`, built lazily: level k is `surface` scaled by 1/2^k.
+
+        :param surface: Full resolution surface
+        """
+        self.surface = surface
+        self.levels = [surface]
+        self._view_key = None
+        self._view = None
+
+    def _level(self, scale):
+        """Return the smallest level at least as large as `scale` and its own scale."""
+        k = 0
+        if scale < 1:
+            k = int(math.floor(math.log2(1 / scale)))
+        while len(self.levels) <= k:
+            previous = self.levels[-1]
+            width, height = previous.get_width() // 2, previous.get_height() // 2
+            if width < 1 or height < 1:
+                break
+            self.levels.append(pygame.transform.smoothscale(previous, (width, height)))
+        level = self.levels[min(k, len(self.levels) - 1)]
+        return level, level.get_width() / self.surface.get_width()
+
+    def get_view(self, scale, offset_x, offset_y, screen_size):
+        """
+        Return the visible part of the surface scaled by `scale` and its position on screen,
+        or None when nothing is visible. The result is reused until an argument changes.
+
+        :param scale: Zoom factor
+        :param offset_x: Horizontal offset of the centered image
+        :param offset_y: Vertical offset of the centered image
+        :param screen_size: (width, height) of the area the image is drawn on
+        """
+        key = (scale, offset_x, offset_y, screen_size)
+        if key != self._view_key:
+            self._view_key = key
+            self._view = self._compute_view(scale, offset_x, offset_y, screen_size)
+        return self._view
+
+    def _compute_view(self, scale, offset_x, offset_y, screen_size):
+        """Scale the visible part of the closest level, see `get_view`."""
+        screen_width, screen_height = screen_size
+        scaled_width = int(self.surface.get_width() * scale)
+        scaled_height = int(self.surface.get_height() * scale)
+        pos_x = (screen_width - scaled_width) // 2 + offset_x
+        pos_y = (screen_height - scaled_height) // 2 + offset_y
+
+        # visible rectangle on screen
+        left, top = max(pos_x, 0), max(pos_y, 0)
+        right = min(pos_x + scaled_width, screen_width)
+        bottom = min(pos_y + scaled_height, screen_height)
+        if right <= left or bottom <= top:
+            return None
+
+        level, level_scale = self._level(scale)
+        # matching rectangle in the level, widened to whole pixels
+        ratio = level_scale / scale
+        level_left = int(math.floor((left - pos_x) * ratio))
+        level_top = int(math.floor((top - pos_y) * ratio))
+        level_right = min(int(math.ceil((right - pos_x) * ratio)), level.get_width())
+        level_bottom = min(int(math.ceil((bottom - pos_y) * ratio)), level.get_height())
+        if level_right <= level_left or level_bottom <= level_top:
+            return None
+
+        region = level.subsurface(pygame.Rect(
+            level_left, level_top, level_right - level_left, level_bottom - level_top
+        ))
+        view_x = pos_x + int(round(level_left / ratio))
+        view_y = pos_y + int(round(level_top / ratio))
+        view_width = max(1, int(round(level_right / ratio)) - (view_x - pos_x))
+        view_height = max(1, int(round(level_bottom / ratio)) - (view_y - pos_y))
+        view = pygame.transform.scale(region, (view_width, view_height))
+        if pygame.display.get_surface() is not None:
+            # in the display pixel format, the view is blitted every frame without conversion
+            view = view.convert_alpha() if view.get_flags() & pygame.SRCALPHA else view.convert()
+        return view, (view_x, view_y)
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+from PIL import Image
+
+from chewie.cache import DecodedImageCache, DerivativeCache
+from chewie.imaging import DOWNSCALE_MODES, load_resized, resize_image
+
+# the JPEG decoder size of an 800x800 source resized to 120x120, per downscale mode:
+# 'fast' drafts to the nearest scale above the size, 'balanced' above twice the size
+DRAFT_SIZES = {'fast': (200, 200), 'balanced': (400, 400), 'best': (800, 800)}
+
+
+def make_sources(tmp_path, count, size=(8, 8), ext='.png'):
+    paths = []
+    for index in range(count):
+        path = str(tmp_path / f'source_{index}{ext}')
+        Image.effect_noise(size, 40 + index).convert('RGB').save(path)
+        paths.append(path)
+    return paths
+
+
+def test_derivative_round_trip(tmp_path):
+    cache = DerivativeCache(str(tmp_path / 'cache'))
+    source, = make_sources(tmp_path, 1)
+    img = Image.effect_noise((20, 10), 50).convert('RGB')
+    assert cache.get_image(source, (20, 10), 'balanced') is None
+    cache.put_image(source, (20, 10), 'balanced', img)
+    cached = cache.get_image(source, (20, 10), 'balanced')
+    assert cached.tobytes() == img.tobytes()
+    # derivatives are kept per size and per downscale mode
+    assert cache.get_image(source, (20, 10), 'fast') is None
+    assert cache.get_image(source, (10, 5), 'balanced') is None
+    cache.put_size(source, (8, 8))
+    cache.flush()
+    assert DerivativeCache(str(tmp_path / 'cache')).get_size(source) == (8, 8)
+
+
+def test_derivative_invalidated_by_change(tmp_path):
+    cache = DerivativeCache(str(tmp_path / 'cache'))
+    source, = make_sources(tmp_path, 1)
+    cache.put_image(source, (4, 4), 'balanced', Image.new('RGB', (4, 4)))
+    Image.new('RGB', (9, 9)).save(source)
+    os.utime(source, (0, 0))
+    assert cache.get_image(source, (4, 4), 'balanced') is None
+
+
+@pytest.mark.parametrize('downscale', DOWNSCALE_MODES)
+def test_load_resized_per_mode(tmp_path, downscale):
+    cache = DerivativeCache(str(tmp_path / 'cache'))
+    source, = make_sources(tmp_path, 1, size=(800, 800), ext='.jpg')
+    with Image.open(source) as img:
+        expected = resize_image(img, (120, 120), downscale)
+        # draft mode shrinks the decoded image in place
+        assert img.size == DRAFT_SIZES[downscale]
+    assert load_resized(source, (120, 120), downscale, cache).tobytes() == expected.tobytes()
+    cached = cache.get_image(source, (120, 120), downscale)
+    assert cached.tobytes() == expected.tobytes()
+    for other in DOWNSCALE_MODES:
+        if other != downscale:
+            assert cache.get_image(source, (120, 120), other) is None
+
+
+def test_derivative_eviction(tmp_path):
+    sources = make_sources(tmp_path, 6)
+    img = Image.effect_noise((64, 64), 80).convert('RGB')
+    cache = DerivativeCache(str(tmp_path / 'cache'), max_bytes=10 ** 9)
+    cache.put_image(sources[0], (64, 64), 'balanced', img)
+    entry_size = sum(size for _, size, _ in cache._scan())
+    # room for three derivatives and a half
+    cache.max_bytes = int(entry_size * 3.5)
+    for index, source in enumerate(sources):
+        cache.put_image(source, (64, 64), 'balanced', img)
+        # order the derivatives by the time they were put
+        mtime = 1000000 + index * 10
+        os.utime(cache._derivative_path(source, (64, 64), 'balanced'), (mtime, mtime))
+    assert sum(size for _, size, _ in cache._scan()) <= cache.max_bytes
+    # the oldest ones were evicted, the latest ones kept
+    assert cache.get_image(sources[0], (64, 64), 'balanced') is None
+    assert cache.get_image(sources[1], (64, 64), 'balanced') is None
+    assert cache.get_image(sources[-2], (64, 64), 'balanced') is not None
+    assert cache.get_image(sources[-1], (64, 64), 'balanced') is not None
+
+
+def test_decoded_cache_eviction(tmp_path):
+    sources = make_sources(tmp_path, 4)
+    img = Image.new('RGB', (10, 10))
+    cache = DecodedImageCache(max_bytes=3 * 10 * 10 * 3)
+    for source in sources:
+        cache.put_image(source, (10, 10), 'balanced', img)
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.get_image(sources[0], (10, 10), 'balanced') is None
+    assert cache.get_image(sources[-1], (10, 10), 'balanced') is img
+    assert cache.get_image(sources[-1], (10, 10), 'fast') is None
+
+
+def test_decoded_cache_least_recently_used(tmp_path):
+    sources = make_sources(tmp_path, 3)
+    cache = DecodedImageCache(max_bytes=2 * 10 * 10 * 3)
+    cache.put_image(sources[0], (10, 10), 'balanced', Image.new('RGB', (10, 10)))
+    cache.put_image(sources[1], (10, 10), 'balanced', Image.new('RGB', (10, 10)))
+    # reading the first image makes the second one the least recently used
+    assert cache.get_image(sources[0], (10, 10), 'balanced') is not None
+    cache.put_image(sources[2], (10, 10), 'balanced', Image.new('RGB', (10, 10)))
+    assert cache.get_image(sources[0], (10, 10), 'balanced') is not None
+    assert cache.get_image(sources[1], (10, 10), 'balanced') is None
+
+
+def test_decoded_cache_parent(tmp_path):
+    source, = make_sources(tmp_path, 1)
+    parent = DerivativeCache(str(tmp_path / 'cache'))
+    img = Image.effect_noise((10, 10), 30).convert('RGB')
+    DecodedImageCache(10 ** 6, parent).put_image(source, (10, 10), 'fast', img)
+    # a fresh memory cache falls back to the images written through to its parent
+    cached = DecodedImageCache(10 ** 6, parent).get_image(source, (10, 10), 'fast')
+    assert cached.tobytes() == img.tobytes()
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+from chewie.canvas import ArrayCanvas, canvas_array
+
+
+def test_numpy_not_imported_at_startup():
+    code = 'import sys, chewie.cli; print("numpy" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_array_canvas_shares_pixels():
+    pytest.importorskip('numpy')
+    canvas = ArrayCanvas(20, 10, (1, 2, 3))
+    canvas.paste(Image.new('RGB', (5, 5), (200, 100, 50)), (2, 3))
+    image = canvas.to_image()
+    assert image.mode == 'RGBX'
+    assert image.getpixel((0, 0))[:3] == (1, 2, 3)
+    assert image.getpixel((4, 5))[:3] == (200, 100, 50)
+    # the image reads the array itself
+    canvas.array[0, 0, :3] = (9, 9, 9)
+    assert image.getpixel((0, 0))[:3] == (9, 9, 9)
+    assert canvas_array(image) is canvas.array
+
+
+def test_array_canvas_alpha():
+    pytest.importorskip('numpy')
+    canvas = ArrayCanvas(10, 10, (0, 0, 0))
+    canvas.paste(Image.new('RGBA', (4, 4), (255, 0, 0, 0)), (0, 0))
+    image = canvas.to_image()
+    assert image.mode == 'RGBA'
+    assert image.getpixel((0, 0)) == (255, 0, 0, 0)
+    assert image.getpixel((9, 9)) == (0, 0, 0, 255)
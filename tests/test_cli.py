@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from click.testing import CliRunner
+from PIL import Image
+
+from chewie.cli import main
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    # keep derivatives out of the user cache
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'images'
+    folder.mkdir()
+    for index, size in enumerate([(40, 30), (30, 40), (50, 50)]):
+        Image.new('RGB', size, (index * 80, 0, 0)).save(folder / f'{index}.png')
+    return folder
+
+
+def break_image(path):
+    """Keep the JPEG signature of the file at `path`, so it is found but can't be decoded."""
+    path.write_bytes(b'\xff\xd8\xff' + b'\x00' * 32)
+
+
+def test_make_collage_no_viewer(tmp_path, folder):
+    output = tmp_path / 'collage.png'
+    result = CliRunner().invoke(main, ['make-collage', str(folder), '-o', str(output),
+                                       '--no-viewer', '--width', '200'])
+    assert result.exit_code == 0, result.output
+    with Image.open(output) as img:
+        assert img.size[0] == 200
+
+
+def test_make_collage_no_viewer_failure(tmp_path, folder):
+    break_image(folder / '1.png')
+    output = tmp_path / 'collage.png'
+    result = CliRunner().invoke(main, ['make-collage', str(folder), '-o', str(output),
+                                       '--no-viewer'])
+    assert result.exit_code == 1
+    assert 'Error: Cannot read' in result.output
+    assert not output.exists()
+
+
+def test_render_plan_failure(tmp_path, folder):
+    plan_file = tmp_path / 'plan.json'
+    result = CliRunner().invoke(main, ['make-collage', str(folder), '-o', str(tmp_path / 'a.png'),
+                                       '--no-viewer', '--save-plan', str(plan_file)])
+    assert result.exit_code == 0, result.output
+    result = CliRunner().invoke(main, ['render-plan', str(plan_file), '-o',
+                                       str(tmp_path / 'b.png'), '--no-viewer'])
+    assert result.exit_code == 0, result.output
+    break_image(folder / '0.png')
+    result = CliRunner().invoke(main, ['render-plan', str(plan_file), '-o',
+                                       str(tmp_path / 'c.png'), '--no-viewer'])
+    assert result.exit_code == 1
+    assert not os.path.exists(tmp_path / 'c.png')
+
+
+def test_batch_failure(tmp_path, folder):
+    break_image(folder / '2.png')
+    result = CliRunner().invoke(main, ['batch', str(folder), '--output-dir', str(tmp_path),
+                                       '--format', 'png'])
+    assert result.exit_code == 1
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+from PIL import Image
+
+from chewie.discovery import discover_images, is_image
+
+FORMATS = ['JPEG', 'PNG', 'GIF', 'BMP', 'TIFF', 'WEBP']
+
+
+@pytest.mark.parametrize('image_format', FORMATS)
+def test_is_image_by_content(tmp_path, image_format):
+    # the extension doesn't matter, only the content does
+    path = tmp_path / 'image.dat'
+    Image.new('RGB', (4, 3), 'red').save(path, image_format)
+    assert is_image(str(path))
+
+
+@pytest.mark.parametrize('content', [
+    b'',
+    b'BM',
+    b'BMW notes about a car\n',
+    b'BM\x00\x00\x00\x00\x00\x00\x00\x00\x36\x00\x00\x00\x99\x00\x00\x00',
+    b'RIFF\x10\x00\x00\x00WAVEfmt ',
+    b'\x00\x00\x00\x00\x00\x00\x00\x00WEBPVP8 ',
+    b'GIF88a',
+    b'plain text',
+])
+def test_is_not_image(tmp_path, content):
+    path = tmp_path / 'file.jpg'
+    path.write_bytes(content)
+    assert not is_image(str(path))
+
+
+def test_discover_images(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    Image.new('RGB', (4, 3), 'red').save(tmp_path / 'a.png')
+    Image.new('RGB', (4, 3), 'red').save(tmp_path / 'sub' / 'b', 'JPEG')
+    (tmp_path / 'notes.txt').write_bytes(b'BM is a BMP magic, this is not one')
+    assert discover_images([str(tmp_path)]) == [str(tmp_path / 'a.png')]
+    assert discover_images([str(tmp_path)], recursive=True) == [
+        str(tmp_path / 'a.png'), str(tmp_path / 'sub' / 'b')
+    ]
+    assert discover_images([str(tmp_path)], recursive=True, exclude=['sub']) == [
+        str(tmp_path / 'a.png')
+    ]
+
+
+def test_discover_images_dedupe(tmp_path):
+    Image.new('RGB', (4, 3), 'red').save(tmp_path / 'a.png')
+    (tmp_path / 'b.png').write_bytes((tmp_path / 'a.png').read_bytes())
+    Image.new('RGB', (4, 3), 'blue').save(tmp_path / 'c.png')
+    assert discover_images([str(tmp_path)], dedupe=True) == [
+        str(tmp_path / 'a.png'), str(tmp_path / 'c.png')
+    ]
+
+
+def test_discover_images_symlink_loop(tmp_path):
+    (tmp_path / 'a').mkdir()
+    Image.new('RGB', (4, 3), 'red').save(tmp_path / 'a' / 'image.png')
+    (tmp_path / 'a' / 'loop').symlink_to('..', target_is_directory=True)
+    (tmp_path / 'b').mkdir()
+    (tmp_path / 'b' / 'link').symlink_to(tmp_path / 'a', target_is_directory=True)
+    # each directory is listed once, whichever way it is reached
+    images = discover_images([str(tmp_path)], recursive=True)
+    assert len(images) == 1
+    assert os.path.samefile(images[0], tmp_path / 'a' / 'image.png')
+
+
+def test_discover_images_symlinked_folder(tmp_path):
+    (tmp_path / 'photos').mkdir()
+    (tmp_path / 'root').mkdir()
+    Image.new('RGB', (4, 3), 'red').save(tmp_path / 'photos' / 'image.png')
+    (tmp_path / 'root' / 'photos').symlink_to(tmp_path / 'photos', target_is_directory=True)
+    assert discover_images([str(tmp_path / 'root')], recursive=True) == [
+        str(tmp_path / 'root' / 'photos' / 'image.png')
+    ]
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from chewie.layout import compute_layout, justified_layout, place_lines
+
+MARGIN = 2
+
+
+def random_sizes(count, seed):
+    rand = random.Random(seed)
+    return [(rand.randint(100, 4000), rand.randint(100, 4000)) for _ in range(count)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('width, row_height', [(800, 150), (3000, 400), (500, 600)])
+def test_justified_full_rows_span_width(seed, width, row_height):
+    sizes = random_sizes(60, seed)
+    lines = justified_layout(sizes, width, row_height, MARGIN)
+    assert sorted(index for _, line in lines for index in line) == list(range(len(sizes)))
+    for line_height, line in lines[:-1]:
+        line_width = sum(line_height * w / h for w, h in (sizes[i] for i in line))
+        assert line_width + MARGIN * (len(line) - 1) == pytest.approx(width)
+    rows, _ = place_lines(sizes, lines[:-1], MARGIN)
+    for _, _, boxes in rows:
+        _, x, box_width = boxes[-1]
+        assert x + box_width == width
+
+
+def test_justified_last_row_keeps_row_height():
+    sizes = [(400, 300)] * 10
+    lines = justified_layout(sizes, 1000, 200, MARGIN)
+    assert lines[-1][0] == 200
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        compute_layout([(100, 100)], 1000, 200, engine='nope')
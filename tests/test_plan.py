@@ -0,0 +1,92 @@
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from chewie import PlanError, plan_collage
+from chewie.plan import LayoutPlan
+
+
+def make_plan(count=40, width=1200, row_height=180, seed=0):
+    rand = random.Random(seed)
+    sizes = [(rand.randint(100, 3000), rand.randint(100, 3000)) for _ in range(count)]
+    images = [f'img_{index}.jpg' for index in range(count)]
+    return LayoutPlan.build(images, sizes, width, row_height)
+
+
+def assert_same_plan(plan, other):
+    assert other.images == plan.images
+    assert other.sizes == plan.sizes
+    assert (other.width, other.height, other.row_height) == (plan.width, plan.height,
+                                                            plan.row_height)
+    assert (other.engine, other.margin_size) == (plan.engine, plan.margin_size)
+    assert other.lines == plan.lines
+    assert other.rows == plan.rows
+
+
+def test_bytes_round_trip():
+    plan = make_plan()
+    assert_same_plan(plan, LayoutPlan.from_bytes(plan.to_bytes()))
+
+
+def test_dict_round_trip():
+    plan = make_plan()
+    assert_same_plan(plan, LayoutPlan.from_dict(plan.to_dict()))
+
+
+def test_from_dict_unsupported_version():
+    data = make_plan().to_dict()
+    data['version'] += 1
+    with pytest.raises(ValueError):
+        LayoutPlan.from_dict(data)
+
+
+@pytest.mark.parametrize('extension', ['.json', '.plan'])
+def test_save_load(tmp_path, extension):
+    plan = make_plan()
+    filename = str(tmp_path / ('plan' + extension))
+    plan.save(filename)
+    assert_same_plan(plan, LayoutPlan.load(filename))
+
+
+def test_hit_test_boxes():
+    plan = make_plan()
+    for index in range(len(plan.images)):
+        x, y, width, height = plan.box_of(index)
+        for px, py in [(x, y), (x + width - 1, y), (x, y + height - 1),
+                       (x + width - 1, y + height - 1), (x + width // 2, y + height // 2)]:
+            assert plan.hit_test(px, py) == index
+
+
+def test_hit_test_margins():
+    plan = make_plan()
+    assert plan.hit_test(-1, 0) is None
+    assert plan.hit_test(0, -1) is None
+    assert plan.hit_test(0, plan.height + 10) is None
+    y, height, boxes = plan.rows[0]
+    _, x, width = boxes[0]
+    # between the first two images of the first row, and below the first row
+    assert plan.hit_test(x + width, y) is None
+    assert plan.hit_test(x, y + height) is None
+
+
+def test_rescale():
+    plan = make_plan()
+    rescaled = plan.rescale(plan.width * 2)
+    assert rescaled.width == plan.width * 2
+    assert [line for _, line in rescaled.lines] == [line for _, line in plan.lines]
+    for _, _, boxes in rescaled.rows[:-1]:
+        _, x, width = boxes[-1]
+        assert x + width == rescaled.width
+
+
+@pytest.mark.parametrize('extension', ['.json', '.plan'])
+def test_save_in_memory_images(tmp_path, extension):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30)).save(buffer, 'PNG')
+    plan = plan_collage([buffer.getvalue(), Image.new('RGB', (30, 40))], 200, 50)
+    filename = tmp_path / ('plan' + extension)
+    with pytest.raises(PlanError, match='in-memory'):
+        plan.save(str(filename))
+    assert not filename.exists()
@@ -0,0 +1,163 @@
+import http.client
+import io
+import json
+import os
+import socket
+import threading
+
+import pytest
+from PIL import Image
+
+from chewie.server import CollageService, create_server, remove_socket
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for index, size in enumerate([(40, 30), (30, 40), (50, 50)]):
+        path = tmp_path / f'{index}.png'
+        Image.new('RGB', size, (index * 80, 0, 0)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def serve(**kwargs):
+    """Start a collage server in a thread, return it and a function making connections."""
+    server = create_server(CollageService(workers=1), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    if kwargs.get('socket_path'):
+        return server, lambda: UnixHTTPConnection(kwargs['socket_path'])
+    return server, lambda: http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+
+
+def stop(server):
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+
+@pytest.fixture
+def tcp_server():
+    server, connect = serve(host='127.0.0.1', port=0)
+    yield connect
+    stop(server)
+
+
+def request(connect, method, path, body=None, headers=None):
+    """Return the status, content type and body of the response to a request."""
+    connection = connect()
+    try:
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        return response.status, response.getheader('Content-Type'), response.read()
+    finally:
+        connection.close()
+
+
+def test_collage(tcp_server, images):
+    status, content_type, data = request(tcp_server, 'POST', '/collage', {
+        'images': images, 'width': 200, 'height': 50, 'format': 'png'
+    })
+    assert status == 200
+    assert content_type == 'image/png'
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == 'PNG'
+        assert img.size[0] == 200
+
+
+@pytest.mark.parametrize('body', [
+    b'not json',
+    b'[]',
+    b'{"images": "a.jpg"}',
+    b'{"images": []}',
+    b'{"images": ["missing.jpg"]}',
+    b'{"images": ["IMAGE"], "width": "wide"}',
+    b'{"images": ["IMAGE"], "format": "nope"}',
+    b'{"images": ["IMAGE"], "quality": 101}',
+])
+def test_invalid_request(tcp_server, images, body):
+    body = body.replace(b'IMAGE', images[0].encode())
+    status, content_type, data = request(tcp_server, 'POST', '/collage', body)
+    assert status == 400
+    assert content_type == 'application/json'
+    assert json.loads(data)['error']
+
+
+def test_unreadable_image(tcp_server, images, tmp_path):
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'\xff\xd8\xff' + b'\x00' * 32)
+    status, _, data = request(tcp_server, 'POST', '/collage', {'images': images + [str(broken)]})
+    assert status == 400
+    assert 'broken.jpg' in json.loads(data)['error']
+
+
+@pytest.mark.parametrize('length', ['-1', 'many'])
+def test_invalid_content_length(tcp_server, length):
+    connection = tcp_server()
+    try:
+        connection.putrequest('POST', '/collage')
+        connection.putheader('Content-Length', length)
+        connection.endheaders()
+        assert connection.getresponse().status == 400
+    finally:
+        connection.close()
+
+
+def test_status(tcp_server, images):
+    status, _, data = request(tcp_server, 'GET', '/status')
+    assert status == 200
+    assert json.loads(data) == {'requests': 0, 'layouts': 0, 'layout_hits': 0, 'layout_misses': 0}
+    for _ in range(2):
+        assert request(tcp_server, 'POST', '/collage', {'images': images})[0] == 200
+    assert request(tcp_server, 'POST', '/collage', {'images': images[:2]})[0] == 200
+    _, _, data = request(tcp_server, 'GET', '/status')
+    assert json.loads(data) == {'requests': 3, 'layouts': 2, 'layout_hits': 1, 'layout_misses': 2}
+
+
+def test_unknown_path(tcp_server):
+    assert request(tcp_server, 'GET', '/nope')[0] == 404
+    assert request(tcp_server, 'POST', '/nope', b'{}')[0] == 404
+
+
+def test_unix_socket(tmp_path, images):
+    socket_path = str(tmp_path / 'chewie.sock')
+    # a socket left by a previous server is replaced
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    server, connect = serve(socket_path=socket_path)
+    try:
+        status, content_type, _ = request(connect, 'POST', '/collage', {'images': images})
+        assert (status, content_type) == (200, 'image/jpeg')
+        assert request(connect, 'GET', '/status')[0] == 200
+    finally:
+        stop(server)
+
+
+def test_socket_path_is_not_a_socket(tmp_path):
+    socket_path = tmp_path / 'notes.txt'
+    socket_path.write_text('keep me')
+    service = CollageService(workers=1)
+    try:
+        with pytest.raises(FileExistsError):
+            create_server(service, socket_path=str(socket_path))
+    finally:
+        service.close()
+    with pytest.raises(FileExistsError):
+        remove_socket(str(socket_path))
+    assert socket_path.read_text() == 'keep me'
+    remove_socket(str(tmp_path / 'missing.sock'))
+    assert not os.path.exists(tmp_path / 'missing.sock')
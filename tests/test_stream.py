@@ -0,0 +1,106 @@
+import json
+import os
+import zlib
+
+import pytest
+from PIL import Image
+
+from chewie.stream import (
+    PngStreamWriter, RawStreamWriter, TiffStreamWriter, adler32_combine, open_stream_writer,
+)
+
+WIDTH, HEIGHT = 37, 50
+
+
+def make_image(mode):
+    """Return a `mode` test image with distinct pixels in every band."""
+    bands = [
+        Image.linear_gradient('L').resize((WIDTH, HEIGHT)),
+        Image.linear_gradient('L').rotate(90).resize((WIDTH, HEIGHT)),
+        Image.effect_noise((WIDTH, HEIGHT), 64),
+        Image.radial_gradient('L').resize((WIDTH, HEIGHT)),
+    ]
+    return Image.merge(mode, bands[:len(mode)])
+
+
+def write_bands(writer, img, band_height=16):
+    """Write `img` to `writer` in bands of `band_height` rows, the last one shorter."""
+    for top in range(0, img.size[1], band_height):
+        writer.write(img.crop((0, top, img.size[0], min(top + band_height, img.size[1]))))
+    writer.close()
+
+
+def assert_same_pixels(img1, img2):
+    assert img1.mode == img2.mode
+    assert img1.size == img2.size
+    assert img1.tobytes() == img2.tobytes()
+
+
+@pytest.mark.parametrize('length1, length2', [(0, 0), (1, 0), (0, 1), (10, 100), (70000, 65521)])
+def test_adler32_combine(length1, length2):
+    data1 = bytes(range(256)) * (length1 // 256) + bytes(range(length1 % 256))
+    data2 = os.urandom(length2)
+    combined = adler32_combine(zlib.adler32(data1), zlib.adler32(data2), len(data2))
+    assert combined == zlib.adler32(data1 + data2)
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_png_round_trip(tmp_path, mode, jobs):
+    img = make_image(mode)
+    filename = str(tmp_path / 'out.png')
+    writer = PngStreamWriter(filename, WIDTH, HEIGHT, mode, jobs=jobs)
+    write_bands(writer, img, band_height=7)
+    with Image.open(filename) as written:
+        written.load()
+        assert_same_pixels(written, img)
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_tiff_round_trip(tmp_path, mode):
+    img = make_image(mode)
+    filename = str(tmp_path / 'out.tif')
+    writer = TiffStreamWriter(filename, WIDTH, HEIGHT, mode)
+    write_bands(writer, img)
+    with Image.open(filename) as written:
+        written.load()
+        assert_same_pixels(written, img)
+
+
+def test_big_tiff_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(TiffStreamWriter, 'BIG_TIFF_BYTES', 0)
+    img = make_image('RGB')
+    filename = str(tmp_path / 'out.tif')
+    writer = TiffStreamWriter(filename, WIDTH, HEIGHT, 'RGB')
+    assert writer.big
+    write_bands(writer, img)
+    with open(filename, 'rb') as f:
+        assert f.read(4) == b'II+\x00'
+    with Image.open(filename) as written:
+        written.load()
+        assert_same_pixels(written, img)
+
+
+def test_raw_round_trip(tmp_path):
+    img = make_image('RGBA')
+    filename = str(tmp_path / 'out.raw')
+    writer = RawStreamWriter(filename, WIDTH, HEIGHT, 'RGBA')
+    write_bands(writer, img)
+    with open(filename + '.json') as f:
+        meta = json.load(f)
+    assert (meta['width'], meta['height'], meta['mode'], meta['channels']) == (WIDTH, HEIGHT,
+                                                                               'RGBA', 4)
+    with open(filename, 'rb') as f:
+        written = Image.frombytes(meta['mode'], (meta['width'], meta['height']), f.read())
+    assert_same_pixels(written, img)
+
+
+def test_open_stream_writer(tmp_path):
+    for name, writer_class in [('a.PNG', PngStreamWriter), ('a.tiff', TiffStreamWriter),
+                               ('a.raw', RawStreamWriter)]:
+        writer = open_stream_writer(str(tmp_path / name), 1, 1)
+        assert isinstance(writer, writer_class)
+        writer.write(Image.new('RGB', (1, 1)))
+        writer.close()
+    with pytest.raises(ValueError):
+        open_stream_writer(str(tmp_path / 'a.jpg'), 1, 1)